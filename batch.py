@@ -0,0 +1,172 @@
+"""Run many queries through the RAG flow concurrently.
+
+Queries come from a JSONL file (one {"query": ...} object or JSON string per
+line) or a directory of .md prompts like query/mug.md. Results are appended
+to a JSONL file as each query finishes.
+
+    python3 batch.py query/ --workers 4 --rate 20 --output query/batch_results.jsonl
+"""
+import os
+import json
+import time
+import argparse
+import logging
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from langchain_community.callbacks import get_openai_callback
+
+from main import query_rag
+from results_log import compact_to_notebook
+
+def load_queries(path):
+    """Returns [(id, query)] from a JSONL file or a directory of .md prompts."""
+    if os.path.isdir(path):
+        queries = []
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith(".md"):
+                with open(os.path.join(path, filename), "r") as file:
+                    prompts = prompts_from_markdown(file.read())
+                if len(prompts) == 1:
+                    queries.append((filename, prompts[0]))
+                else:
+                    queries.extend((f"{filename}#{index}", prompt) for index, prompt in enumerate(prompts, start=1))
+        return queries
+
+    queries = []
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                queries.append((f"{path}:{line_number}", item))
+            else:
+                queries.append((item.get("id", f"{path}:{line_number}"), item["query"]))
+    return queries
+
+def prompts_from_markdown(text):
+    """Extracts prompts from saved results such as query/mug.md or query/generated_results.md.
+
+    Every line starting with `###` opens a section whose prompt is that line
+    plus the `#` lines directly after it; the code that follows is ignored.
+    Files without such a header are used whole.
+    """
+    sections = []
+    in_header = False
+    for line in text.splitlines():
+        if line.startswith("###"):
+            sections.append([line.lstrip("#")])
+            in_header = True
+        elif in_header and line.startswith("#"):
+            sections[-1].append(line.lstrip("#"))
+        else:
+            in_header = False
+
+    prompts = [prompt for prompt in ("\n".join(lines).strip() for lines in sections) if prompt]
+    return prompts or [text.strip()]
+
+class RateLimiter:
+    """Spaces out calls to at most `per_minute` starts per minute (no limit if falsy)."""
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def run_one(query_id, query_text, rate_limiter):
+    rate_limiter.wait()
+    start = time.perf_counter()
+    with get_openai_callback() as usage:
+        shared = query_rag(query_text, echo=False)
+    return {
+        "id": query_id,
+        "query": query_text,
+        "code_response": shared.get("code_response"),
+        "sources": shared.get("sources"),
+        "error": shared.get("error"),
+        "semantic_cache_hit": shared.get("semantic_cache_hit"),
+        "latency": time.perf_counter() - start,
+        "timings": shared.get("timings", {}),
+        "generation": shared.get("generation"),
+        "tokens": {
+            "prompt": usage.prompt_tokens,
+            "completion": usage.completion_tokens,
+            "total": usage.total_tokens,
+            "cost_usd": usage.total_cost,
+        },
+    }
+
+def run_batch(queries, output_path, workers=4, rate_per_minute=0):
+    rate_limiter = RateLimiter(rate_per_minute)
+    write_lock = threading.Lock()
+    results = []
+    start = time.perf_counter()
+
+    with open(output_path, "a") as output, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_one, query_id, query_text, rate_limiter) for query_id, query_text in queries]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            with write_lock:
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+            status = "failed" if result["error"] or not result["code_response"] else "done"
+            logging.info(f"[{len(results)}/{len(queries)}] {status} in {result['latency']:.1f}s: {result['id']}")
+
+    return summarize(results, time.perf_counter() - start)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+def summarize(results, wall_seconds):
+    latencies = [result["latency"] for result in results]
+    ttfts = [result["generation"]["ttft"] for result in results if result.get("generation")]
+    failed = sum(1 for result in results if result["error"] or not result["code_response"])
+    return {
+        "queries": len(results),
+        "failed": failed,
+        "wall_seconds": wall_seconds,
+        "queries_per_minute": len(results) / wall_seconds * 60 if wall_seconds else 0.0,
+        "latency_p50": statistics.median(latencies) if latencies else 0.0,
+        "latency_p95": percentile(latencies, 0.95),
+        "ttft_p50": statistics.median(ttfts) if ttfts else 0.0,
+        "prompt_tokens": sum(result["tokens"]["prompt"] for result in results),
+        "completion_tokens": sum(result["tokens"]["completion"] for result in results),
+        "total_tokens": sum(result["tokens"]["total"] for result in results),
+        "cost_usd": sum(result["tokens"]["cost_usd"] for result in results),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="JSONL file of queries or a directory of .md prompts.")
+    parser.add_argument("--output", default="./query/batch_results.jsonl", help="JSONL file results are appended to.")
+    parser.add_argument("--workers", type=int, default=4, help="Queries in flight at once.")
+    parser.add_argument("--rate", type=float, default=0, help="Max queries started per minute (0 = unlimited).")
+    args = parser.parse_args()
+
+    queries = load_queries(args.input)
+    print(f"🚀 Running {len(queries)} queries with {args.workers} workers")
+    summary = run_batch(queries, args.output, workers=args.workers, rate_per_minute=args.rate)
+    compact_to_notebook()
+
+    print(f"✅ {summary['queries'] - summary['failed']}/{summary['queries']} succeeded in {summary['wall_seconds']:.1f}s "
+          f"({summary['queries_per_minute']:.1f} queries/min)")
+    print(f"⏱️  Latency p50 {summary['latency_p50']:.1f}s, p95 {summary['latency_p95']:.1f}s, "
+          f"first token p50 {summary['ttft_p50']:.1f}s")
+    print(f"🔢 Tokens: {summary['prompt_tokens']} prompt + {summary['completion_tokens']} completion "
+          f"= {summary['total_tokens']} (${summary['cost_usd']:.4f})")
+    print(f"📄 Results: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Chunking throughput over the documents/ corpus.
+
+Compares iter_chunks with the previous string-concatenating splitter, on the
+real corpus and on a synthetic markdown file with one long fenced code block
+(where the old splitter went quadratic).
+
+    python -m benchmarks.chunking
+"""
+import argparse
+import time
+
+from populate_database import FILE_PATH, CHUNK_SIZE, CHUNK_OVERLAP, iter_chunks, load_documents
+
+def legacy_chunks(text, chunk_size):
+    # The pre-streaming split_with_overlap loop, kept for comparison
+    chunks = []
+    current_chunk = ""
+    in_code_block = False
+    for line in text.splitlines(keepends=True):
+        if line.strip().startswith("```"):
+            in_code_block = not in_code_block
+        if in_code_block:
+            current_chunk += line
+        else:
+            if len(current_chunk) + len(line) > chunk_size:
+                chunks.append(current_chunk)
+                current_chunk = line
+            else:
+                current_chunk += line
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+def synthetic_markdown(code_lines):
+    prose = "".join(f"Paragraph line {i} describing a Workplane operation.\n" for i in range(2000))
+    code = "".join(f"result = result.faces('>Z').workplane().hole({i})\n" for i in range(code_lines))
+    return prose + "```python\n" + code + "```\n" + prose
+
+def bench(label, texts, split):
+    total_chars = sum(len(text) for text in texts)
+    start = time.perf_counter()
+    chunk_count = sum(len(split(text)) for text in texts)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {chunk_count:>6} chunks  {elapsed * 1000:9.1f} ms  {total_chars / elapsed / 1e6:8.1f} MB/s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--code-lines", type=int, default=200000,
+                        help="Lines in the synthetic fenced code block.")
+    args = parser.parse_args()
+
+    corpus = [doc.page_content for doc in load_documents(FILE_PATH)]
+    synthetic = [synthetic_markdown(args.code_lines)]
+
+    for name, texts in (("corpus", corpus), ("synthetic", synthetic)):
+        bench(f"{name}: legacy", texts, lambda text: legacy_chunks(text, CHUNK_SIZE))
+        bench(f"{name}: iter_chunks", texts, lambda text: list(iter_chunks(text, CHUNK_SIZE, CHUNK_OVERLAP)))
+
+if __name__ == "__main__":
+    main()
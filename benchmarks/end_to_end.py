@@ -0,0 +1,290 @@
+"""End-to-end benchmark of the RAG flow over the golden queries (benchmarks/golden.json).
+
+Every golden query runs through query_rag, uncached: the semantic cache is
+skipped and the LLM response cache is bypassed unless --use-llm-cache is set.
+Each run records:
+
+- the wall time of every node, AnalyzeQuery through SaveToNotebook (plus the
+  Prepare and RetrieveAndEvaluate groups they run in);
+- prompt and completion tokens;
+- retrieval recall against the query's labels, over the candidates and over
+  the reranked chunks that reach the prompt (see benchmarks/golden.py);
+- whether the generated script passed VerifyCode (it runs locally).
+
+The report is written as JSON to --output: the configuration that affects
+the numbers (git commit, models, prompt hash, retrieval settings), every
+run, and a summary. With --baseline it is compared to an earlier report.
+The comparison exits with status 1 on a drop in pass rate or recall, or on
+latency or token growth past the tolerances. The first --warmup queries run
+untimed, and results go to a temporary log, so they stay out of
+query/result.ipynb.
+
+    python -m benchmarks.end_to_end --runs 3 --output e2e.json
+    python -m benchmarks.end_to_end --baseline e2e.json
+    python -m benchmarks.end_to_end --stub    # offline, against stub_server.py
+
+--stub starts stub_server.py and a temporary store ingested with its
+embeddings (as benchmarks.service_load does). The numbers then measure the
+pipeline, not the models.
+"""
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.golden import GOLDEN_PATH, load_golden, recall
+from benchmarks.service_load import start_stub_store
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "reports", "end_to_end.json")
+NODE_NOISE_SECONDS = 0.05  # node slowdowns smaller than this are not regressions
+ERROR_CHARS = 300
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+def mean(values):
+    values = [value for value in values if value is not None]
+    return statistics.mean(values) if values else None
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+def sha(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+def collect_config(golden_path, stub):
+    import main
+    import reranker
+    import retriever
+    import context_builder
+    import populate_database
+    from embeddings import embedder_id, get_embedding_function
+
+    model = main.get_openai_model(use_cache=False)
+    embedder = embedder_id(get_embedding_function())
+    llm_base_url = main.LLM_BASE_URL
+    if stub:
+        # The stub's port changes every run; keep it out of the comparison
+        embedder, llm_base_url = embedder.replace(llm_base_url, "stub"), "stub"
+    with open(golden_path, "rb") as file:
+        golden_sha = hashlib.sha256(file.read()).hexdigest()[:12]
+    return {
+        "git_commit": git_commit(),
+        "stub": stub,
+        "model": model.model_name,
+        "reasoning_effort": model.reasoning_effort,
+        "llm_base_url": llm_base_url,
+        "embedder": embedder,
+        "prompt_sha": sha(main.PROMPT_TEMPLATE),
+        "golden": golden_path,
+        "golden_sha": golden_sha,
+        "chunk_size": populate_database.CHUNK_SIZE,
+        "chunk_overlap": populate_database.CHUNK_OVERLAP,
+        "retrieval_backend": retriever.RETRIEVAL_BACKEND,
+        "hybrid_candidates": retriever.HYBRID_CANDIDATES,
+        "rerank_candidates": reranker.RERANK_CANDIDATES,
+        "rerank_top_n": reranker.RERANK_TOP_N,
+        "mmr_lambda": reranker.MMR_LAMBDA,
+        "context_token_budget": context_builder.CONTEXT_TOKEN_BUDGET,
+        "max_generation_attempts": main.MAX_GENERATION_ATTEMPTS,
+        "stream_generation": main.STREAM_GENERATION,
+        "llm_cache": not main.LLM_CACHE_BYPASS,
+    }
+
+def run_query(entry, run):
+    from langchain_community.callbacks import get_openai_callback
+    from main import query_rag
+
+    start = time.perf_counter()
+    with get_openai_callback() as usage:
+        shared = query_rag(entry["query"], use_semantic_cache=False, echo=False)
+    latency = time.perf_counter() - start
+
+    verification = shared.get("code_verification") or {}
+    # A missing CadQuery says nothing about the script, so it counts as not checked
+    checked = "valid" in verification and verification.get("stage") != "environment"
+    generation = shared.get("generation") or {}
+    return {
+        "id": entry["id"],
+        "run": run,
+        "latency": latency,
+        "error": shared.get("error"),
+        "timings": shared.get("timings", {}),
+        "tokens": {"prompt": usage.prompt_tokens, "completion": usage.completion_tokens,
+                   "total": usage.total_tokens, "cost_usd": usage.total_cost},
+        "ttft": generation.get("ttft"),
+        "generation_attempts": shared.get("generation_attempts", 0),
+        "context": shared.get("context_report"),
+        "recall": {
+            "candidates": recall(entry["labels"], [chunk for chunk, _ in shared.get("candidates", [])]),
+            "retrieved": recall(entry["labels"], [chunk for chunk, _ in shared.get("retrieved", [])]),
+        },
+        "sources": shared.get("sources"),
+        "passed": bool(verification.get("valid")) if checked else None,
+        "verification": {"stage": verification.get("stage"),
+                         "error": (verification.get("error") or "")[:ERROR_CHARS] or None},
+    }
+
+def summarize(runs):
+    latencies = [run["latency"] for run in runs]
+    checked = [run["passed"] for run in runs if run["passed"] is not None]
+    node_names = sorted({name for run in runs for name in run["timings"]})
+    nodes = {}
+    for name in node_names:
+        seconds = [run["timings"][name] for run in runs if name in run["timings"]]
+        nodes[name] = {"n": len(seconds), "mean": statistics.mean(seconds), "p50": statistics.median(seconds),
+                       "p95": percentile(seconds, 0.95)}
+    return {
+        "runs": len(runs),
+        "errors": sum(1 for run in runs if run["error"]),
+        "checked": len(checked),
+        "pass_rate": sum(checked) / len(checked) if checked else None,
+        "recall_candidates": mean([run["recall"]["candidates"] for run in runs]),
+        "recall_retrieved": mean([run["recall"]["retrieved"] for run in runs]),
+        "latency_p50": statistics.median(latencies) if latencies else 0.0,
+        "latency_p95": percentile(latencies, 0.95),
+        "ttft_p50": statistics.median([run["ttft"] for run in runs if run["ttft"] is not None] or [0.0]),
+        "prompt_tokens_mean": mean([run["tokens"]["prompt"] for run in runs]),
+        "completion_tokens_mean": mean([run["tokens"]["completion"] for run in runs]),
+        "generation_attempts_mean": mean([run["generation_attempts"] for run in runs]),
+        "nodes": nodes,
+    }
+
+def compare(summary, baseline, max_slowdown=0.25, max_token_growth=0.10, max_drop=0.05):
+    """Returns a line per regression of `summary` against the `baseline` summary."""
+    regressions = []
+    for key in ("pass_rate", "recall_candidates", "recall_retrieved"):
+        new, old = summary.get(key), baseline.get(key)
+        if new is not None and old is not None and new < old - max_drop:
+            regressions.append(f"{key}: {old:.2f} -> {new:.2f}")
+
+    def grew(key, new, old, tolerance, floor=0.0):
+        if new is not None and old and new > old * (1 + tolerance) and new - old > floor:
+            regressions.append(f"{key}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)")
+
+    for key in ("latency_p50", "latency_p95"):
+        grew(key, summary.get(key), baseline.get(key), max_slowdown)
+    for key in ("prompt_tokens_mean", "completion_tokens_mean"):
+        grew(key, summary.get(key), baseline.get(key), max_token_growth)
+    for name, node in summary.get("nodes", {}).items():
+        old = baseline.get("nodes", {}).get(name)
+        if old is not None:
+            grew(f"{name} p50", node["p50"], old["p50"], max_slowdown, NODE_NOISE_SECONDS)
+    return regressions
+
+def print_summary(summary):
+    pass_rate = "n/a" if summary["pass_rate"] is None else f"{summary['pass_rate'] * 100:.0f}%"
+    recalls = [summary["recall_candidates"], summary["recall_retrieved"]]
+    recalls = ["n/a" if value is None else f"{value:.2f}" for value in recalls]
+    print(f"✅ {summary['runs']} runs, {summary['errors']} errors, pass rate {pass_rate} of {summary['checked']} checked")
+    print(f"🔎 Recall: candidates {recalls[0]}, prompt {recalls[1]}")
+    print(f"⏱️  Latency p50 {summary['latency_p50']:.2f}s, p95 {summary['latency_p95']:.2f}s, "
+          f"first token p50 {summary['ttft_p50']:.2f}s")
+    print(f"🔢 Tokens per query: {summary['prompt_tokens_mean'] or 0:.0f} prompt + "
+          f"{summary['completion_tokens_mean'] or 0:.0f} completion")
+    for name, node in summary["nodes"].items():
+        print(f"   {name:<32} p50={node['p50'] * 1000:8.1f} ms  p95={node['p95'] * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--golden", default=GOLDEN_PATH, help="Golden set built by benchmarks.golden.")
+    parser.add_argument("--runs", type=int, default=1, help="Passes over the golden set.")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed queries run before the benchmark.")
+    parser.add_argument("--only", nargs="*", help="Golden IDs to run (default: all).")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where the JSON report is written.")
+    parser.add_argument("--baseline", help="Earlier report to compare against; exits 1 on regressions.")
+    parser.add_argument("--stub", action="store_true", help="Run offline against stub_server.py and a temporary store.")
+    parser.add_argument("--use-llm-cache", action="store_true", help="Answer repeated model calls from the response cache.")
+    parser.add_argument("--max-slowdown", type=float, default=0.25, help="Tolerated relative latency growth.")
+    parser.add_argument("--max-token-growth", type=float, default=0.10, help="Tolerated relative token growth.")
+    parser.add_argument("--max-drop", type=float, default=0.05, help="Tolerated absolute drop in pass rate or recall.")
+    args = parser.parse_args()
+
+    golden = load_golden(args.golden)
+    if args.only:
+        golden = [entry for entry in golden if entry["id"] in args.only]
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+
+    workdir = tempfile.TemporaryDirectory(prefix="cadgpt-e2e-")
+    stub = None
+    try:
+        # Settings are read when the modules are imported, so they go into the environment first
+        if args.stub:
+            env, stub, ingestion = start_stub_store(workdir.name)
+            os.environ.update(env)
+            print(f"🧪 Ingested documents/ with stub embeddings in {ingestion:.1f}s")
+        os.environ["SEMANTIC_CACHE_BYPASS"] = "1"
+        os.environ["RESULTS_LOG_PATH"] = os.path.join(workdir.name, "results.jsonl")
+        if not args.use_llm_cache:
+            os.environ["LLM_CACHE_BYPASS"] = "1"
+
+        from retriever import get_retriever, close_retriever
+        from guide_index import get_guide_index
+        from worker_pool import get_worker_pool
+
+        # Open everything and warm up first so the first query's node timings are comparable to the rest
+        start = time.perf_counter()
+        get_retriever().open()
+        get_guide_index().refresh()
+        pool = get_worker_pool()
+        if pool is not None:
+            pool.warm_up()
+        config = collect_config(args.golden, args.stub)
+        for entry in golden[:args.warmup]:
+            run_query(entry, run=None)  # first calls open connections and fill in-process caches
+        print(f"🚀 Running {len(golden)} golden queries x {args.runs} (warm-up {time.perf_counter() - start:.1f}s)")
+
+        runs = []
+        for run in range(args.runs):
+            for entry in golden:
+                result = run_query(entry, run)
+                runs.append(result)
+                status = result["error"] or {True: "passed", False: "failed", None: "not checked"}[result["passed"]]
+                print(f"[{len(runs)}/{len(golden) * args.runs}] {entry['id']}: {status} in {result['latency']:.1f}s")
+        close_retriever()
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+        workdir.cleanup()
+
+    summary = summarize(runs)
+    report = {"created": time.time(), "config": config, "summary": summary, "runs": runs}
+    if baseline is not None:
+        report["baseline"] = {"path": args.baseline, "config": baseline["config"],
+                              "regressions": compare(summary, baseline["summary"], args.max_slowdown,
+                                                     args.max_token_growth, args.max_drop)}
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print_summary(summary)
+    print(f"📄 Report: {args.output}")
+    if baseline is not None:
+        changed = [key for key, value in config.items() if key != "git_commit" and baseline["config"].get(key) != value]
+        if changed:
+            print(f"ℹ️  Changed since the baseline: {', '.join(changed)}")
+        regressions = report["baseline"]["regressions"]
+        for line in regressions:
+            print(f"❌ Regression: {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
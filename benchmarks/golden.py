@@ -0,0 +1,134 @@
+"""Golden queries for benchmarks.end_to_end, built from the saved prompts in query/.
+
+Each section of query/*.md (and query/generated_results.md) is a prompt made
+of `#`-prefixed lines followed by the reference script, fenced or not. Every
+section becomes one golden entry:
+
+    {"id": "mug.md", "query": "...", "reference_code": "...", "labels": [{"contains": "threePointArc"}]}
+
+Labels mark what retrieval should bring back. A chunk satisfies
+`{"contains": term}` if its text contains the term and `{"source": text}` if
+its ID (path:page:hash) contains the text. --build picks the LABELS_PER_QUERY
+methods of the reference script that are rarest in documents/ (but present,
+so they can be retrieved) as `contains` labels. The written file is meant
+to be reviewed and edited by hand; rebuilding overwrites it.
+
+    python -m benchmarks.golden --build query/
+"""
+import argparse
+import glob
+import json
+import os
+import re
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "golden.json")
+LABELS_PER_QUERY = 3
+CALL_PATTERN = re.compile(r"(?:(\w+)\s*)?\.\s*([A-Za-z_]\w*)\s*\(")
+# Calls on these are plain Python, not CadQuery
+NON_CADQUERY_OWNERS = {"math", "np", "numpy", "os", "sys", "random", "str", "list", "dict"}
+NON_CADQUERY_METHODS = {"append", "extend", "items", "keys", "values", "format", "join", "split", "strip",
+                        "get", "update", "isValid", "val", "vals", "display", "show_object"}
+
+def parse_sections(text):
+    """Returns [(prompt, code)] for the `#`-header + code sections of a saved query file."""
+    sections = []
+    in_fence = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+            if in_fence and not sections:
+                sections.append(([], []))
+            continue
+        if not in_fence and line.startswith("##"):
+            if not sections or sections[-1][1]:
+                sections.append(([], []))
+            sections[-1][0].append(line.lstrip("#").strip())
+        elif sections and (in_fence or sections[-1][0]):
+            sections[-1][1].append(line)
+
+    results = []
+    for prompt_lines, code_lines in sections:
+        prompt = "\n".join(prompt_lines).strip()
+        code = "\n".join(code_lines).strip()
+        if prompt and code:
+            results.append((prompt, code))
+    return results
+
+def called_methods(code):
+    """CadQuery-looking method names called in `code`, in order of first use."""
+    methods = []
+    for owner, method in CALL_PATTERN.findall(code):
+        if owner in NON_CADQUERY_OWNERS or method in NON_CADQUERY_METHODS or method in methods:
+            continue
+        methods.append(method)
+    return methods
+
+def document_frequencies(terms, documents):
+    return {term: sum(1 for document in documents if term in document.page_content) for term in terms}
+
+def derive_labels(code, documents, limit=LABELS_PER_QUERY):
+    """The `limit` methods of `code` found in the fewest documents (pages), as `contains` labels."""
+    frequencies = document_frequencies(called_methods(code), documents)
+    present = sorted((count, term) for term, count in frequencies.items() if count)
+    return [{"contains": term} for _, term in present[:limit]]
+
+def build_golden(paths, documents):
+    golden = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.md"))) if os.path.isdir(path) else [path]
+        for file_path in files:
+            with open(file_path, "r") as file:
+                sections = parse_sections(file.read())
+            name = os.path.basename(file_path)
+            for index, (prompt, code) in enumerate(sections, start=1):
+                golden.append({
+                    "id": name if len(sections) == 1 else f"{name}#{index}",
+                    "query": prompt,
+                    "reference_code": code,
+                    "labels": derive_labels(code, documents),
+                })
+    return golden
+
+def load_golden(path=GOLDEN_PATH):
+    with open(path, "r") as file:
+        return json.load(file)
+
+def chunk_matches(label, chunk):
+    """Whether a retrieved langchain Document satisfies a golden label."""
+    if "contains" in label and label["contains"] not in chunk.page_content:
+        return False
+    if "source" in label and label["source"] not in (chunk.metadata.get("id") or ""):
+        return False
+    return True
+
+def recall(labels, chunks):
+    """Fraction of `labels` satisfied by at least one of `chunks`; None without labels."""
+    if not labels:
+        return None
+    return sum(any(chunk_matches(label, chunk) for chunk in chunks) for label in labels) / len(labels)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", default=["query/"], help="Query .md files or directories of them.")
+    parser.add_argument("--build", action="store_true", help="Rebuild the golden set and write it to --output.")
+    parser.add_argument("--output", default=GOLDEN_PATH)
+    args = parser.parse_args()
+
+    if args.build:
+        from populate_database import load_documents, FILE_PATH
+
+        golden = build_golden(args.paths, load_documents(FILE_PATH))
+        with open(args.output, "w") as file:
+            json.dump(golden, file, indent=2)
+            file.write("\n")
+        print(f"✅ Wrote {len(golden)} golden queries to {args.output}")
+    else:
+        golden = load_golden(args.output)
+
+    for entry in golden:
+        labels = ", ".join(next(iter(label.values())) for label in entry["labels"]) or "-"
+        print(f"{entry['id']:<28} {labels}")
+
+if __name__ == "__main__":
+    main()
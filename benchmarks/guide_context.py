@@ -0,0 +1,90 @@
+"""Prompt size and preparation latency: whole guide vs. the indexed guide sections.
+
+"full" is what GenerateCode used to do: read documents/cadquery-improvement-guide.md
+on every call and paste all of it into the prompt. "indexed" scores the
+sections held by the in-memory GuideIndex and fills the CONTEXT_TOKEN_BUDGET
+with build_context. Retrieved chunks are left out of both, so no collection
+is needed. Query embeddings are computed up front, as the semantic cache
+does in the flow. With --generate every prompt is also sent to the model
+(uncached) to time generation. That calls the API, so mind the cost.
+
+    python -m benchmarks.guide_context query/ --runs 5
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+
+def load_queries(paths):
+    queries = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.md"))) if os.path.isdir(path) else [path]
+        for file_path in files:
+            with open(file_path, "r") as file:
+                queries.append((os.path.basename(file_path), file.read()))
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", default=["query/"], help="Query .md files or directories of them.")
+    parser.add_argument("--runs", type=int, default=5, help="Prompt builds per query for the timings.")
+    parser.add_argument("--generate", action="store_true", help="Also time generation with each prompt (API calls).")
+    args = parser.parse_args()
+
+    from langchain.prompts import ChatPromptTemplate
+    from context_builder import build_context
+    from guide_index import GuideIndex, GUIDE_PATH
+    from main import PROMPT_TEMPLATE, FEW_SHOT_EXAMPLES, get_openai_model
+    from tokens import count_tokens
+
+    template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+
+    def full_prompt(query, _):
+        with open(GUIDE_PATH, "r") as file:
+            return template.format(context=file.read(), question=query)
+
+    start = time.perf_counter()
+    index = GuideIndex()
+    index.refresh()
+    print(f"GuideIndex: {len(index.sections)} sections loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def indexed_prompt(query, embedding):
+        sections = index.score(query, embedding)
+        context, _ = build_context(query, guide_sections=[section for section, _ in sections],
+                                   section_scores=[score for _, score in sections], examples=FEW_SHOT_EXAMPLES)
+        return template.format(context=context, question=query)
+
+    queries = load_queries(args.paths)
+    embeddings = index._embedder().embed_documents([query for _, query in queries])
+    model = get_openai_model(use_cache=False) if args.generate else None
+    totals = {}
+    for (name, query), embedding in zip(queries, embeddings):
+        for label, build in (("full", full_prompt), ("indexed", indexed_prompt)):
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                prompt = build(query, embedding)
+                timings.append(time.perf_counter() - start)
+            tokens = count_tokens([prompt], "o200k_base")[0]
+            line = f"{name:<24} {label:<8} prompt={tokens:6d} tokens  prep p50={statistics.median(timings) * 1000:6.2f} ms"
+            total = totals.setdefault(label, {"tokens": 0, "prep": 0.0, "generate": 0.0})
+            total["tokens"] += tokens
+            total["prep"] += statistics.median(timings)
+            if model is not None:
+                start = time.perf_counter()
+                model.invoke(prompt)
+                seconds = time.perf_counter() - start
+                total["generate"] += seconds
+                line += f"  generate={seconds:6.2f} s"
+            print(line)
+
+    for label, total in totals.items():
+        line = (f"{label:<8} mean prompt={total['tokens'] / len(queries):7.0f} tokens  "
+                f"mean prep={total['prep'] / len(queries) * 1000:6.2f} ms")
+        if model is not None:
+            line += f"  mean generate={total['generate'] / len(queries):6.2f} s"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Pages/second of extract_and_merge_blocks for 1..N worker processes.
+
+Every parallel run is checked against the single-process output.
+
+    python -m benchmarks.pdf_extraction --max-workers 8
+"""
+import argparse
+import os
+import time
+
+from populate_database import extract_and_merge_blocks
+
+DEFAULT_PDF = "./documents/cadquery-stable.pdf"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--runs", type=int, default=3, help="Best-of runs per worker count.")
+    args = parser.parse_args()
+
+    import pymupdf as fitz
+    with fitz.open(args.pdf) as doc:
+        page_count = len(doc)
+
+    baseline = None
+    print(f"{args.pdf}: {page_count} pages")
+    for workers in range(1, args.max_workers + 1):
+        best = float("inf")
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            chunks = extract_and_merge_blocks(args.pdf, workers=workers)
+            best = min(best, time.perf_counter() - start)
+
+        result = [(chunk.page_content, chunk.metadata) for chunk in chunks]
+        if baseline is None:
+            baseline = result
+        match = "ok" if result == baseline else "MISMATCH"
+        print(f"workers={workers:<3} {page_count / best:8.1f} pages/s  ({best:.2f}s, {len(chunks)} chunks, {match})")
+
+if __name__ == "__main__":
+    main()
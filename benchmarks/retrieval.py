@@ -0,0 +1,62 @@
+"""Cold vs. warm retrieval latency over the existing collection.
+
+Cold opens a fresh Retriever (Chroma + embedding client) for every query, which
+is what RetrieveContext used to do. Warm reuses one Retriever for all queries.
+
+    python -m benchmarks.retrieval --runs 5
+"""
+import argparse
+import statistics
+import time
+
+from retriever import Retriever
+
+DEFAULT_QUERIES = [
+    "produce me a simple gear",
+    "Create a parametric mug with a handle",
+    "twistExtrude a parametricCurve",
+    "Create a box with a hole through the top face",
+    "Shell a cube and chamfer the inside edges",
+]
+
+def time_cold(queries, runs):
+    timings = []
+    for _ in range(runs):
+        for query in queries:
+            start = time.perf_counter()
+            retriever = Retriever()
+            retriever.similarity_search_with_score(query, k=5)
+            timings.append(time.perf_counter() - start)
+            retriever.close()
+    return timings
+
+def time_warm(queries, runs):
+    retriever = Retriever()
+    retriever.open()
+    timings = []
+    for _ in range(runs):
+        for query in queries:
+            start = time.perf_counter()
+            retriever.similarity_search_with_score(query, k=5)
+            timings.append(time.perf_counter() - start)
+    retriever.close()
+    return timings
+
+def report(label, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<6} n={len(timings):<4} mean={statistics.mean(timings) * 1000:8.1f} ms  "
+          f"p50={statistics.median(timings) * 1000:8.1f} ms  p95={p95 * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3, help="Passes over the query list.")
+    parser.add_argument("queries", nargs="*", help="Queries to run (defaults to a built-in set).")
+    args = parser.parse_args()
+    queries = args.queries or DEFAULT_QUERIES
+
+    report("cold", time_cold(queries, args.runs))
+    report("warm", time_warm(queries, args.runs))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Load test for server.py against the stub OpenAI endpoint, fully offline.
+
+Starts stub_server.py (configure it with the STUB_* variables), ingests
+documents/ into a temporary store with its embeddings, starts the service on
+that store with LLM_BASE_URL and EMBEDDING_BASE_URL pointed at the stub,
+and fires --requests queries, --concurrency at a time. It then reports the
+ingestion time, requests/s and latency percentiles. The LLM and semantic
+caches are bypassed so every request runs the whole flow, and the results
+log and notebook go to the temporary directory too; the run fails if it
+changed the checkout. Use --url to load an already running service instead.
+
+    python -m benchmarks.service_load --requests 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tempfile
+
+import httpx
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_stub_store(workdir):
+    """Starts stub_server.py and ingests documents/ into a store under `workdir` with its embeddings.
+    Returns (env, stub process, ingestion seconds); env points the flow at the stub and that store."""
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}/v1"
+    # Stub embeddings get their own embedder ID, so they need a store of their own
+    env = {**os.environ, "LLM_BASE_URL": stub_url, "EMBEDDING_BASE_URL": stub_url,
+           "CHROMA_PATH": os.path.join(workdir, "chroma"),
+           "INGEST_MANIFEST_PATH": os.path.join(workdir, "manifest.json"),
+           "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical_index"),
+           "VECTOR_INDEX_PATH": os.path.join(workdir, "vector_index"),
+           "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite3"),
+           # The service logs every answer and compacts the log into a notebook on shutdown
+           "RESULTS_LOG_PATH": os.path.join(workdir, "results.jsonl"),
+           "RESULTS_NOTEBOOK_PATH": os.path.join(workdir, "result.ipynb")}
+    stub = subprocess.Popen([sys.executable, "-m", "stub_server", "--port", str(stub_port)], env=env)
+    try:
+        asyncio.run(wait_until_up(f"{stub_url}/models", stub))
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "populate_database"], env=env, check=True, stdout=subprocess.DEVNULL)
+    except BaseException:
+        stub.terminate()
+        raise
+    return env, stub, time.perf_counter() - start
+
+def tree_status():
+    """`git status` of the checkout, ignored files included but not bytecode; None outside git."""
+    try:
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=all", "--ignored"],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return {line for line in status.splitlines() if "__pycache__/" not in line}
+
+def start_service(port, env):
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--loop", "uvloop",
+                             "--log-level", "warning"], env=env)
+
+async def wait_until_up(url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+async def run_load(url, queries, requests, concurrency, timeout):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(client, index):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/query", json={"query": queries[index % len(queries)]})
+                failed = response.status_code != 200 or response.json().get("error")
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += bool(failed)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, index) for index in range(requests)))
+        wall = time.perf_counter() - start
+    return latencies, errors, wall
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--url", help="Load this running service instead of starting one.")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds.")
+    parser.add_argument("queries", nargs="*", help="Queries to send (defaults to a built-in set).")
+    args = parser.parse_args()
+    # Not at the top: end_to_end imports this module before it sets the store paths retriever reads
+    from benchmarks.retrieval import DEFAULT_QUERIES
+
+    processes = []
+    url = args.url
+    tree_before = tree_status()
+    workdir = tempfile.TemporaryDirectory(prefix="cadgpt-load-")
+    try:
+        if url is None:
+            env, stub, ingestion = start_stub_store(workdir.name)
+            processes.append(stub)
+            print(f"ingestion {ingestion:.1f}s")
+
+            service_port = free_port()
+            env.update({"LLM_CACHE_BYPASS": "1", "SEMANTIC_CACHE_BYPASS": "1"})
+            processes.append(start_service(service_port, env))
+            url = f"http://127.0.0.1:{service_port}"
+        asyncio.run(wait_until_up(f"{url}/health", processes[1] if processes else None))
+
+        latencies, errors, wall = asyncio.run(run_load(url, args.queries or DEFAULT_QUERIES, args.requests,
+                                                       args.concurrency, args.timeout))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        workdir.cleanup()
+
+    print(f"{len(latencies)} requests, concurrency {args.concurrency}, {errors} failed, {wall:.1f}s")
+    print(f"throughput {len(latencies) / wall:.2f} req/s")
+    print(f"latency p50={statistics.median(latencies) * 1000:.0f} ms  p95={percentile(latencies, 0.95) * 1000:.0f} ms  "
+          f"p99={percentile(latencies, 0.99) * 1000:.0f} ms  max={max(latencies) * 1000:.0f} ms")
+
+    tree_after = tree_status()
+    if args.url is None and tree_before is not None and tree_after != tree_before:
+        print("❌ The run changed the working tree; everything it writes belongs in its temporary directory:")
+        for line in sorted(tree_after ^ tree_before):
+            print(f"   {line}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Cold-process vs. warm-pool validation throughput.
+
+Validates the code blocks saved in query/generated_results.md plus
+query/sample.py, first with a fresh interpreter per script, then through a
+CadQueryWorkerPool.
+
+    python -m benchmarks.validation --jobs 20 --pool-size 2
+"""
+import argparse
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from code_validator import validate_code
+from worker_pool import CadQueryWorkerPool
+
+def sample_scripts():
+    with open("./query/generated_results.md", "r") as file:
+        scripts = re.findall(r"```[^\n]*\n(.*?)```", file.read(), flags=re.S)
+    with open("./query/sample.py", "r") as file:
+        scripts.append(file.read())
+    return scripts
+
+def run(label, jobs, workers, validate):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        reports = list(executor.map(validate, jobs))
+    elapsed = time.perf_counter() - start
+    valid = sum(1 for report in reports if report["valid"])
+    print(f"{label:<6} {len(jobs)} scripts in {elapsed:6.2f}s  {len(jobs) / elapsed:6.2f} scripts/s  ({valid} valid)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    scripts = sample_scripts()
+    jobs = [scripts[i % len(scripts)] for i in range(args.jobs)]
+
+    run("cold", jobs, args.pool_size, validate_code)
+
+    pool = CadQueryWorkerPool(size=args.pool_size)
+    pool.warm_up()
+    run("warm", jobs, args.pool_size, lambda code: validate_code(code, pool=pool))
+    pool.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Chroma vs. memory-mapped NumPy index: search latency, RSS and agreement.
+
+Each backend runs in its own interpreter so RSS is not shared between them.
+Query embeddings are computed once up front, so the timings cover only the
+search and the document fetch, which is the part that differs. Run
+populate_database.py first so both stores hold the same collection.
+
+    python -m benchmarks.vector_backends --runs 20
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.retrieval import DEFAULT_QUERIES
+
+def current_rss_mb():
+    import psutil
+    return psutil.Process().memory_info().rss / 2**20
+
+def run_backend(backend, queries, runs, k):
+    from embeddings import get_embedding_function
+    from retriever import Retriever
+
+    embeddings = get_embedding_function().embed_documents(queries)
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    retriever = Retriever(backend=backend)
+    vector_store = retriever.open()
+    open_seconds = time.perf_counter() - start
+
+    if backend == "numpy":
+        def search(embedding):
+            return [vector_store._document(row).id for row, _ in vector_store.search_by_vector(embedding, k)]
+    else:
+        def search(embedding):
+            results = vector_store.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+            return [document.id for document, _ in results]
+
+    timings = []
+    for _ in range(runs):
+        for embedding in embeddings:
+            start = time.perf_counter()
+            search(embedding)
+            timings.append(time.perf_counter() - start)
+    return {
+        "backend": type(vector_store).__name__,
+        "open_ms": open_seconds * 1000,
+        "rss_mb": current_rss_mb() - rss_before,
+        "timings": timings,
+        "results": [search(embedding) for embedding in embeddings],
+    }
+
+def report(result):
+    timings = sorted(result["timings"])
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{result['backend']:<17} open={result['open_ms']:7.1f} ms  +RSS={result['rss_mb']:6.1f} MB  "
+          f"p50={statistics.median(timings) * 1000:7.3f} ms  p95={p95 * 1000:7.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20, help="Passes over the query list.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)  # child mode
+    parser.add_argument("queries", nargs="*", help="Queries to run (defaults to a built-in set).")
+    args = parser.parse_args()
+    queries = args.queries or DEFAULT_QUERIES
+
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, queries, args.runs, args.k)))
+        return
+
+    results = {}
+    for backend in ("chroma", "numpy"):
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.vector_backends", "--backend", backend,
+             "--runs", str(args.runs), "--k", str(args.k), *queries],
+            capture_output=True, text=True, check=True,
+        )
+        results[backend] = json.loads(completed.stdout.strip().splitlines()[-1])
+        report(results[backend])
+
+    # HNSW is approximate and ranks by L2, the NumPy search is exact and ranks by cosine.
+    # For unit-length embeddings (OpenAI's are) the two orders agree.
+    overlaps = [len(set(chroma) & set(exact)) / max(len(exact), 1)
+                for chroma, exact in zip(results["chroma"]["results"], results["numpy"]["results"])]
+    print(f"top-{args.k} overlap: {statistics.mean(overlaps):.0%}")
+
+if __name__ == "__main__":
+    main()
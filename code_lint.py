@@ -0,0 +1,419 @@
+"""Static checks on generated CadQuery scripts, run before anything executes.
+
+Catches what PROMPT_TEMPLATE forbids and what would only fail at run time:
+`.cylinder()`, `show()`/`show_object()`, a missing `import cadquery as cq`,
+no `display(...)`, undefined names and methods `cq.Workplane` does not have.
+The mechanical ones are fixed in place; the rest send the script back to
+generation. The Workplane method table ships as data in cadquery_api.json,
+one entry per CadQuery version. For a version not listed there it is
+introspected once, in a validation pool worker or a child interpreter, and
+cached in CADQUERY_API_PATH, so linting never imports CadQuery into the
+serving process. After upgrading CadQuery, add its table with
+
+    python3 code_lint.py --update-api
+"""
+import io
+import os
+import sys
+import ast
+import tokenize
+import json
+import typing
+import inspect
+import builtins
+import logging
+import threading
+import subprocess
+from importlib import metadata
+from dotenv import load_dotenv
+from code_validator import strip_code_fences
+
+load_dotenv()
+
+CADQUERY_API_PATH = os.getenv('CADQUERY_API_PATH', "./.cadquery_api.json")
+SHIPPED_API_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cadquery_api.json")
+INTROSPECT_TIMEOUT = 120.0  # seconds; a cold interpreter has to import CadQuery
+
+# Provided by the notebook / validator namespace
+SCRIPT_GLOBALS = {"display", "show_object", "show"}
+# Set for every module; not all of them are in dir(builtins)
+MODULE_GLOBALS = {"__file__", "__name__", "__doc__", "__builtins__", "__spec__", "__loader__", "__package__",
+                  "__cached__", "__annotations__"}
+DISPLAY_CALLS = {"display", "show_object", "show"}
+
+_api_lock = threading.Lock()
+_api_tables = {}
+
+def _read_table(path, version):
+    """Methods for `version` from a {version: methods} file, or None."""
+    try:
+        with open(path, "r") as file:
+            return json.load(file).get(version)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _write_table(path, version, methods):
+    tables = {}
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as file:
+                tables = json.load(file)
+        except (OSError, ValueError):
+            pass
+    tables[version] = methods
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(tables, file, indent=1, sort_keys=True)
+        file.write("\n")
+    os.replace(tmp_path, path)
+
+def workplane_api(path=CADQUERY_API_PATH):
+    """{method name: whether it returns a Workplane} for cq.Workplane, or None
+    when CadQuery is not installed or its table could not be built."""
+    try:
+        version = metadata.version("cadquery")
+    except metadata.PackageNotFoundError:
+        return None
+
+    with _api_lock:
+        if path in _api_tables:
+            return _api_tables[path]
+        methods = _read_table(SHIPPED_API_PATH, version) or _read_table(path, version)
+        if methods is None:
+            methods = introspect_out_of_process()
+            if methods is None:
+                return None  # lint without the method check this time; try again next time
+            try:
+                _write_table(path, version, methods)
+            except OSError:
+                pass
+        _api_tables[path] = methods
+        return methods
+
+def introspect_out_of_process():
+    """introspect_workplane() in a warm validation worker, or else a child interpreter."""
+    from worker_pool import get_worker_pool
+
+    try:
+        pool = get_worker_pool()
+        if pool is not None:
+            return pool.call(introspect_workplane, timeout=INTROSPECT_TIMEOUT)
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--introspect"],
+                                   capture_output=True, text=True, timeout=INTROSPECT_TIMEOUT, check=True)
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    except Exception as e:
+        logging.warning(f"Could not introspect cq.Workplane, skipping the method check: {e}")
+        return None
+
+def introspect_workplane():
+    import cadquery as cq
+
+    methods = {}
+    for name in dir(cq.Workplane):
+        if name.startswith("_"):
+            continue
+        attribute = getattr(cq.Workplane, name)
+        returns = inspect.Parameter.empty
+        if callable(attribute):
+            try:
+                returns = inspect.signature(attribute).return_annotation
+            except (TypeError, ValueError):
+                pass
+        # Chain methods are annotated `-> T` (bound to Workplane) or `-> Workplane`
+        methods[name] = isinstance(returns, typing.TypeVar) or returns in (cq.Workplane, "Workplane")
+    return methods
+
+class _Script:
+    """Names, imports and Workplane expressions of a parsed script."""
+    def __init__(self, tree, api):
+        self.tree = tree
+        self.api = api
+        self.bound = set()
+        self.loaded = {}  # name -> first line it is read on
+        self.star_import = False
+        self.cadquery_names = set()  # `cq` in `import cadquery as cq`
+        self.workplane_names = set()  # `Workplane` in `from cadquery import Workplane`
+        self.extra_methods = set()  # attributes the script patches onto Workplane
+        assignments = {}
+        other_bindings = set()
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name):
+                if isinstance(node.ctx, ast.Load):
+                    self.loaded.setdefault(node.id, node.lineno)
+                else:
+                    self.bound.add(node.id)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.bound.add(node.name)
+                other_bindings.add(node.name)
+            elif isinstance(node, ast.arg):
+                self.bound.add(node.arg)
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                self.bound.add(node.name)
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    name = alias.asname or alias.name.split(".")[0]
+                    self.bound.add(name)
+                    if alias.name == "cadquery":
+                        self.cadquery_names.add(name)
+            elif isinstance(node, ast.ImportFrom):
+                for alias in node.names:
+                    if alias.name == "*":
+                        self.star_import = True
+                        continue
+                    self.bound.add(alias.asname or alias.name)
+                    if node.module == "cadquery" and alias.name == "Workplane":
+                        self.workplane_names.add(alias.asname or alias.name)
+            elif hasattr(ast, "MatchAs") and isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+                self.bound.add(node.name)
+
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        assignments.setdefault(target.id, []).append(node.value)
+                    elif isinstance(target, ast.Attribute):
+                        self.extra_methods.add(target.attr)
+            elif isinstance(node, (ast.AugAssign, ast.AnnAssign, ast.For, ast.AsyncFor, ast.NamedExpr, ast.comprehension)):
+                other_bindings.update(child.id for child in ast.walk(node.target) if isinstance(child, ast.Name))
+            elif isinstance(node, (ast.With, ast.AsyncWith)):
+                for item in node.items:
+                    if item.optional_vars is not None:
+                        other_bindings.update(child.id for child in ast.walk(item.optional_vars) if isinstance(child, ast.Name))
+
+        if "cq" not in self.bound:
+            self.cadquery_names.add("cq")  # the import gets added by the fixes
+
+        # A variable holds a Workplane if every assignment to it is a Workplane chain.
+        # Start from all candidates so `r = r.faces(...)` keeps `r` a Workplane.
+        self.workplane_vars = set(assignments) - other_bindings
+        changed = True
+        while changed:
+            changed = False
+            for name in list(self.workplane_vars):
+                if not all(self.is_workplane(value) for value in assignments[name]):
+                    self.workplane_vars.discard(name)
+                    changed = True
+
+    def is_workplane(self, node):
+        if isinstance(node, ast.Name):
+            return node.id in self.workplane_vars
+        if not isinstance(node, ast.Call):
+            return False
+        func = node.func
+        if isinstance(func, ast.Name):
+            return func.id in self.workplane_names
+        if not isinstance(func, ast.Attribute):
+            return False
+        if func.attr == "Workplane" and isinstance(func.value, ast.Name) and func.value.id in self.cadquery_names:
+            return True
+        return bool(self.api) and self.is_workplane(func.value) and self.api.get(func.attr, False)
+
+    def calls(self, names):
+        return [node for node in ast.walk(self.tree)
+                if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in names]
+
+    def method_calls(self, name=None):
+        return [node for node in ast.walk(self.tree)
+                if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and (name is None or node.func.attr == name) and self.is_workplane(node.func.value)]
+
+def _segment(source, node):
+    return ast.get_source_segment(source, node)
+
+def _cylinder_replacement(source, call):
+    """`.circle(r).extrude(h)` for a cylinder() call, or None if its options have no simple equivalent."""
+    names = ["height", "radius", "direct", "angle", "centered", "combine", "clean"]
+    if len(call.args) > 2 or any(keyword.arg is None for keyword in call.keywords):
+        return None
+    arguments = dict(zip(names, call.args))
+    arguments.update({keyword.arg: keyword.value for keyword in call.keywords})
+    if "height" not in arguments or "radius" not in arguments or set(arguments) - {"height", "radius", "centered"}:
+        return None
+
+    height = _segment(source, arguments["height"])
+    radius = _segment(source, arguments["radius"])
+    try:
+        centered = ast.literal_eval(arguments["centered"]) if "centered" in arguments else True
+    except ValueError:
+        return None
+    if centered in (True, (True, True, True), [True, True, True]):
+        # cylinder() centres along its axis too: extrude half each way
+        return f".circle({radius}).extrude(({height}) / 2, both=True)"
+    if centered in ((True, True, False), [True, True, False]):
+        return f".circle({radius}).extrude({height})"
+    return None
+
+def _apply_edits(source, edits):
+    """Replaces (start, end, text) spans given as (lineno, col) pairs, col in UTF-8 bytes."""
+    lines = source.encode("utf-8").splitlines(keepends=True)
+    starts = [0]
+    for line in lines:
+        starts.append(starts[-1] + len(line))
+    data = source.encode("utf-8")
+    for (start_line, start_col), (end_line, end_col), text in sorted(edits, reverse=True):
+        start = starts[start_line - 1] + start_col
+        end = starts[end_line - 1] + end_col
+        data = data[:start] + text.encode("utf-8") + data[end:]
+    return data.decode("utf-8")
+
+def _fix(source, script):
+    edits = []
+    fixes = []
+
+    for call in script.calls({"show", "show_object"} - script.bound):
+        if call.args:
+            edits.append(((call.lineno, call.col_offset), (call.end_lineno, call.end_col_offset),
+                          f"display({_segment(source, call.args[0])})"))
+            fixes.append(f"{call.func.id}() -> display() (line {call.lineno})")
+
+    for call in script.method_calls("cylinder"):
+        replacement = _cylinder_replacement(source, call)
+        if replacement is not None:
+            receiver = call.func.value
+            edits.append(((receiver.end_lineno, receiver.end_col_offset), (call.end_lineno, call.end_col_offset), replacement))
+            fixes.append(f".cylinder() -> .circle().extrude() (line {call.lineno})")
+
+    fixed = _apply_edits(source, edits) if edits else source
+
+    if "cq" in script.loaded and "cq" not in script.bound:
+        fixed = "import cadquery as cq\n" + fixed
+        fixes.append("added `import cadquery as cq`")
+
+    if not script.calls(DISPLAY_CALLS) and "result" in script.bound:
+        fixed = fixed.rstrip() + "\ndisplay(result)\n"
+        fixes.append("added `display(result)`")
+    return fixed, fixes
+
+def _problems(script):
+    problems = []
+    for call in script.method_calls("cylinder"):
+        problems.append(f"line {call.lineno}: .cylinder() is not allowed, use .circle().extrude()")
+
+    if not script.calls(DISPLAY_CALLS) and "result" not in script.bound:
+        problems.append("the script neither calls display() nor defines `result`")
+
+    if not script.star_import:
+        known = script.bound | SCRIPT_GLOBALS | MODULE_GLOBALS | set(dir(builtins))
+        for name, lineno in sorted(script.loaded.items(), key=lambda item: item[1]):
+            if name not in known:
+                problems.append(f"line {lineno}: name `{name}` is not defined")
+
+    problems.extend(_unknown_methods(script))
+    return problems
+
+def _unknown_methods(script):
+    problems = []
+    if script.api:
+        for call in script.method_calls():
+            method = call.func.attr
+            if method not in script.api and method not in script.extra_methods:
+                problems.append(f"line {call.lineno}: cq.Workplane has no method `{method}`")
+    return problems
+
+def lint_code(code_response, api=None):
+    """Returns a report dict: `valid`, `stage` (ok, syntax or lint), `error`, `fixes`
+    (what was rewritten) and `code`, the script with those fixes applied."""
+    code = strip_code_fences(code_response)
+    try:
+        tree = ast.parse(code, "<generated>")
+    except SyntaxError as e:
+        return {"valid": False, "stage": "syntax", "error": f"{e.msg} (line {e.lineno}): {(e.text or '').strip()}",
+                "fixes": [], "code": code}
+
+    api = workplane_api() if api is None else api
+    fixed, fixes = _fix(code, _Script(tree, api))
+    if fixes:
+        tree = ast.parse(fixed, "<generated>")
+    problems = _problems(_Script(tree, api))
+    return {
+        "valid": not problems,
+        "stage": "lint" if problems else "ok",
+        "error": "; ".join(problems) or None,
+        "fixes": fixes,
+        "code": fixed,
+    }
+
+# Lines that continue the statement above them even at column 0
+CONTINUATION_PREFIXES = (")", "]", "}", ".", "#", "@", "else", "elif", "except", "finally")
+
+class StatementLinter:
+    """Lints a script while it is being generated.
+
+    Text is fed in as it streams; whenever a line at column 0 starts a new
+    statement, everything before it is complete and gets checked. Only
+    problems the rest of the script cannot fix are reported: syntax errors
+    and methods cq.Workplane does not have. Names that may still be defined
+    later, `display()` and fixable calls are left to lint_code.
+    """
+    def __init__(self, api=None):
+        self.api = workplane_api() if api is None else api
+        self.lines = []
+        self.problems = []
+        self._partial = ""
+        self._fenced = None  # None until the first code line shows whether the script is in a ``` fence
+        self._closed = False
+        self._checked = 0
+
+    def feed(self, text):
+        """Adds streamed text; returns the problems found in newly completed statements."""
+        self._partial += text
+        *complete, self._partial = self._partial.split("\n")
+        found = []
+        for line in complete:
+            found.extend(self._add_line(line))
+        return found
+
+    def finish(self):
+        """Checks whatever is left once the stream ends."""
+        found = self._add_line(self._partial) if self._partial else []
+        self._partial = ""
+        return found + self._check(len(self.lines))
+
+    def _add_line(self, line):
+        if self._closed:
+            return []
+        if line.lstrip().startswith("```"):
+            if self._fenced:
+                self._closed = True
+                return self._check(len(self.lines))
+            self._fenced = True
+            return []
+        if self._fenced is None and line.strip():
+            self._fenced = False
+        if self._fenced is None:
+            return []
+        previous = next((previous for previous in reversed(self.lines) if previous.strip()), "")
+        self.lines.append(line)
+        if line[:1].strip() and not line.startswith(CONTINUATION_PREFIXES) and not previous.startswith("@"):
+            return self._check(len(self.lines) - 1)
+        return []
+
+    def _check(self, end):
+        if end <= self._checked or self.problems:
+            return []
+        source = "\n".join(self.lines[:end]) + "\n"
+        try:
+            for _ in tokenize.generate_tokens(io.StringIO(source).readline):
+                pass
+        except (tokenize.TokenError, SyntaxError):
+            return []  # Still inside brackets or a string: not a statement boundary after all
+        self._checked = end
+        try:
+            tree = ast.parse(source, "<generated>")
+        except SyntaxError as e:
+            found = [f"line {e.lineno}: {e.msg}: {(e.text or '').strip()}"]
+        else:
+            found = _unknown_methods(_Script(tree, self.api))
+        self.problems.extend(found)
+        return found
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--introspect"]:
+        # Child side of introspect_out_of_process
+        print(json.dumps(introspect_workplane()))
+    elif sys.argv[1:] == ["--update-api"]:
+        version = metadata.version("cadquery")
+        _write_table(SHIPPED_API_PATH, version, introspect_workplane())
+        print(f"✅ Added the cq.Workplane table for CadQuery {version} to {SHIPPED_API_PATH}")
+    else:
+        sys.exit("usage: python3 code_lint.py --update-api")
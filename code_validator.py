@@ -0,0 +1,187 @@
+"""Local validation of generated CadQuery scripts.
+
+The script is compiled in-process to catch syntax errors, then executed in a
+separate interpreter with CPU, memory and wall-clock limits, a throwaway
+working directory, only the SANDBOX_ENV_KEYS environment variables (no API
+keys) and a stubbed `display()`. The child reports whether `result` (or the last displayed
+object) is a valid, non-empty solid, with its bounding box and volume.
+"""
+import os
+import sys
+import json
+import tempfile
+import subprocess
+from dotenv import load_dotenv
+
+load_dotenv()
+
+VALIDATION_TIMEOUT = float(os.getenv('VALIDATION_TIMEOUT', "60"))  # seconds
+VALIDATION_MEMORY_MB = int(os.getenv('VALIDATION_MEMORY_MB', "4096"))
+# All the generated script's interpreter gets from our environment
+SANDBOX_ENV_KEYS = ("PATH", "PYTHONPATH", "HOME", "TMPDIR", "LANG", "LC_ALL", "LD_LIBRARY_PATH", "SYSTEMROOT")
+
+def sandbox_env():
+    return {key: os.environ[key] for key in SANDBOX_ENV_KEYS if key in os.environ}
+
+def scrub_environment():
+    """Drops every variable but SANDBOX_ENV_KEYS from this process's environment.
+    Needed in the sandbox itself too: importing this module runs load_dotenv() again."""
+    kept = sandbox_env()
+    os.environ.clear()
+    os.environ.update(kept)
+
+def strip_code_fences(code_response):
+    return code_response.replace("```python","").replace("```","").strip()
+
+def validate_code(code_response, timeout=VALIDATION_TIMEOUT, memory_mb=VALIDATION_MEMORY_MB, pool=None):
+    """Returns a report dict: `valid`, `stage` (ok, syntax, exception, result, timeout or
+    environment), `error`, and for solids `solids`, `volume` and `bounding_box`.
+
+    `environment` means the sandbox itself could not run CadQuery, which says
+    nothing about the script. With a `pool` (worker_pool.CadQueryWorkerPool)
+    the script runs in a warm worker instead of a fresh interpreter.
+    """
+    code = strip_code_fences(code_response)
+    try:
+        compile(code, "<generated>", "exec")
+    except SyntaxError as e:
+        return {"valid": False, "stage": "syntax", "error": f"{e.msg} (line {e.lineno}): {(e.text or '').strip()}"}
+
+    if pool is not None:
+        return validate_in_pool(code, pool, timeout)
+
+    with tempfile.TemporaryDirectory(prefix="cadgpt-validate-") as workdir:
+        try:
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__)],
+                input=code,
+                capture_output=True,
+                text=True,
+                cwd=workdir,  # files the script exports land in a throwaway directory
+                env=sandbox_env(),  # generated code never sees OPENAI_API_KEY and the like
+                timeout=timeout,
+                preexec_fn=_limit_resources(timeout, memory_mb) if os.name == "posix" else None,
+            )
+        except subprocess.TimeoutExpired:
+            return {"valid": False, "stage": "timeout", "error": f"Script did not finish within {timeout:.0f}s"}
+
+    return parse_child_report(completed.stdout, completed.stderr, completed.returncode)
+
+def validate_in_pool(code, pool, timeout):
+    from worker_pool import WorkerTimeout, WorkerDied
+
+    try:
+        return pool.call(run_script, code, timeout=timeout)
+    except WorkerTimeout:
+        return {"valid": False, "stage": "timeout", "error": f"Script did not finish within {timeout:.0f}s"}
+    except WorkerDied as e:
+        # Killed by the memory limit or crashed inside OCP
+        return {"valid": False, "stage": "exception", "error": str(e)}
+
+def parse_child_report(stdout, stderr, returncode):
+    """Reads the JSON report the child prints as its last stdout line."""
+    lines = stdout.strip().splitlines()
+    if lines:
+        try:
+            return json.loads(lines[-1])
+        except json.JSONDecodeError:
+            pass
+    # No report: the child was killed (e.g. by the CPU or memory limit) or crashed in OCP
+    error = stderr.strip().splitlines()[-1] if stderr.strip() else f"Validator exited with code {returncode}"
+    return {"valid": False, "stage": "exception", "error": error}
+
+def _limit_resources(cpu_seconds, memory_mb):
+    def apply():
+        import resource
+        cpu = int(cpu_seconds) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+        memory = memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        except (ValueError, OSError):
+            pass  # not enforceable on every platform (e.g. macOS)
+    return apply
+
+def describe_result(obj):
+    """Report for whatever the script left in `result`."""
+    import cadquery as cq
+
+    if isinstance(obj, cq.Workplane):
+        shapes = [value for value in obj.vals() if isinstance(value, cq.Shape)]
+        if not shapes:
+            return {"valid": False, "stage": "result", "error": "`result` Workplane holds no shapes"}
+        shape = shapes[0] if len(shapes) == 1 else cq.Compound.makeCompound(shapes)
+    elif isinstance(obj, cq.Assembly):
+        shape = obj.toCompound()
+    elif isinstance(obj, cq.Shape):
+        shape = obj
+    else:
+        return {"valid": False, "stage": "result", "error": f"`result` is a {type(obj).__name__}, not a CadQuery object"}
+
+    solids = shape.Solids()
+    if not solids:
+        return {"valid": False, "stage": "result", "error": "`result` contains no solids"}
+    if not shape.isValid():
+        return {"valid": False, "stage": "result", "error": "`result` is not a valid solid"}
+
+    volume = shape.Volume()
+    if volume <= 0:
+        return {"valid": False, "stage": "result", "error": "`result` has zero volume"}
+
+    box = shape.BoundingBox()
+    return {
+        "valid": True,
+        "stage": "ok",
+        "error": None,
+        "solids": len(solids),
+        "volume": volume,
+        "bounding_box": {
+            "min": [box.xmin, box.ymin, box.zmin],
+            "max": [box.xmax, box.ymax, box.zmax],
+            "size": [box.xlen, box.ylen, box.zlen],
+        },
+    }
+
+def run_script(code):
+    """Executes a script with display()/show_object() stubbed and reports on its result."""
+    import traceback
+    from contextlib import redirect_stdout
+
+    try:
+        import cadquery  # noqa: F401
+    except Exception as e:
+        return {"valid": False, "stage": "environment", "error": f"CadQuery unavailable: {e}"}
+
+    displayed = []
+    def display(obj, *args, **kwargs):
+        displayed.append(obj)
+
+    # __file__ in the throwaway working directory, so scripts exporting next to themselves still run
+    namespace = {"__name__": "__main__", "__file__": os.path.join(os.getcwd(), "generated.py"),
+                 "display": display, "show_object": display, "show": display}
+    try:
+        # Keep the script's own prints off stdout, which carries the report
+        with redirect_stdout(sys.stderr):
+            exec(compile(code, "<generated>", "exec"), namespace)
+    except SystemExit:
+        pass  # a script calling exit() still gets its result checked
+    except MemoryError:
+        return {"valid": False, "stage": "exception", "error": "MemoryError: script exceeded the memory limit"}
+    except Exception as e:
+        script_lines = [frame.lineno for frame in traceback.extract_tb(e.__traceback__) if frame.filename == "<generated>"]
+        where = f" (line {script_lines[-1]})" if script_lines else ""
+        return {"valid": False, "stage": "exception", "error": f"{type(e).__name__}: {e}{where}"}
+
+    obj = namespace.get("result", displayed[-1] if displayed else None)
+    if obj is None:
+        return {"valid": False, "stage": "result", "error": "Script defines no `result` and displays nothing"}
+    try:
+        return describe_result(obj)
+    except Exception as e:
+        return {"valid": False, "stage": "result", "error": f"Could not inspect result: {type(e).__name__}: {e}"}
+
+if __name__ == "__main__":
+    # Child side of validate_code: script on stdin, JSON report on the last stdout line
+    scrub_environment()
+    report = run_script(sys.stdin.read())
+    print(json.dumps(report))
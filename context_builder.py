@@ -0,0 +1,103 @@
+"""Token-budgeted prompt context for GenerateCode.
+
+Candidates for the prompt are the reranked chunks, the sections of the
+improvement guide and the few-shot examples. Each gets a value (chunk
+relevance, how much of the query a guide section covers, a flat prior for
+examples and for the guide's core sections) and is counted with the
+o3-mini tokenizer; the most valuable ones are added until
+CONTEXT_TOKEN_BUDGET is spent.
+"""
+import os
+import re
+import math
+from dotenv import load_dotenv
+from lexical_index import tokenize
+from reranker import term_coverage
+from tokens import count_tokens
+
+load_dotenv()
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', "2000"))
+PROMPT_ENCODING = "o200k_base"  # o3-mini
+EXAMPLE_VALUE = 0.5
+# General advice every script benefits from, whatever the query
+CORE_GUIDE_SECTIONS = ("Core Principles for 3D CAD Generation", "Common Errors and Solutions")
+CORE_GUIDE_VALUE = 0.8
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^\s*```")
+
+def split_sections(markdown, max_level=3):
+    """Splits a markdown guide at headings up to `max_level` (deeper ones stay in their
+    section), ignoring `#` comment lines inside code fences. Returns [{"title", "text"}];
+    titles include their parents, e.g. "Sweep Operation Troubleshooting > Best Practices"."""
+    sections = []
+    path = []
+    title, lines = None, []
+    in_fence = False
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if title is not None and "\n" in body:  # skip headings with nothing under them
+            sections.append({"title": title, "text": body})
+
+    for line in markdown.splitlines():
+        if FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else HEADING_PATTERN.match(line)
+        if match and len(match.group(1)) <= max_level:
+            flush()
+            level = len(match.group(1))
+            path = path[:level - 1] + [match.group(2)]
+            # Leave the document title (level 1) out of section titles
+            title, lines = " > ".join(path[1:] or path), [line]
+        else:
+            lines.append(line)
+    flush()
+    return sections
+
+def score_sections(query, sections):
+    """How much of the query's vocabulary each section covers, weighted by IDF across sections."""
+    section_terms = [set(tokenize(section["title"] + "\n" + section["text"])) for section in sections]
+    query_terms = set(tokenize(query))
+    weights = {}
+    for term in query_terms:
+        frequency = sum(1 for terms in section_terms if term in terms)
+        weights[term] = math.log(1 + len(sections) / (frequency + 0.5))
+    return [term_coverage(weights, terms) for terms in section_terms]
+
+def build_context(query, chunks=(), guide_sections=(), examples=(), budget=CONTEXT_TOKEN_BUDGET, section_scores=None):
+    """Returns (context text, report). `chunks` are [(Document, relevance)] best first;
+    `section_scores` overrides the lexical guide-section scores."""
+    section_scores = score_sections(query, guide_sections) if section_scores is None else section_scores
+    candidates = []
+    for index, (document, relevance) in enumerate(chunks):
+        candidates.append({"kind": "chunk", "order": index, "value": relevance, "text": document.page_content})
+    for index, (section, score) in enumerate(zip(guide_sections, section_scores)):
+        value = max(score, CORE_GUIDE_VALUE) if section["title"].split(" > ")[0] in CORE_GUIDE_SECTIONS else score
+        candidates.append({"kind": "guide", "order": index, "value": value, "text": section["text"]})
+    for index, example in enumerate(examples):
+        candidates.append({"kind": "example", "order": index, "value": EXAMPLE_VALUE, "text": example})
+
+    for candidate, tokens in zip(candidates, count_tokens([c["text"] for c in candidates], PROMPT_ENCODING)):
+        candidate["tokens"] = tokens
+
+    # Most valuable first; anything that no longer fits is skipped, smaller items may still fit
+    selected = []
+    used = 0
+    for candidate in sorted(candidates, key=lambda c: c["value"], reverse=True):
+        if candidate["value"] > 0 and used + candidate["tokens"] <= budget:
+            selected.append(candidate)
+            used += candidate["tokens"]
+
+    parts = []
+    for kind, heading in (("guide", "Guidelines"), ("example", "Examples"), ("chunk", "Reference material")):
+        texts = [c["text"] for c in sorted((c for c in selected if c["kind"] == kind), key=lambda c: c["order"])]
+        if texts:
+            parts.append(f"{heading}:\n\n" + "\n\n---\n\n".join(texts))
+
+    report = {"budget": budget, "tokens": used}
+    for kind in ("chunk", "guide", "example"):
+        report[f"{kind}s"] = sum(1 for c in selected if c["kind"] == kind)
+        report[f"{kind}s_dropped"] = sum(1 for c in candidates if c["kind"] == kind) - report[f"{kind}s"]
+    return "\n\n===\n\n".join(parts), report
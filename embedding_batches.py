@@ -0,0 +1,76 @@
+"""Concurrent, token-budgeted embedding for ingestion.
+
+Texts are grouped into batches of at most EMBED_BATCH_TOKENS tokens and
+EMBED_BATCH_SIZE inputs (the embeddings API rejects larger requests), and
+up to EMBED_CONCURRENCY batches are in flight at once. A failed batch (rate
+limit, timeout, dropped connection) is retried with exponential backoff
+and jitter before the whole run gives up.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from dotenv import load_dotenv
+from tokens import count_tokens
+
+load_dotenv()
+
+EMBED_BATCH_TOKENS = int(os.getenv('EMBED_BATCH_TOKENS', "100000"))
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', "256"))
+EMBED_CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', "4"))
+EMBED_MAX_RETRIES = int(os.getenv('EMBED_MAX_RETRIES', "5"))
+EMBED_BACKOFF_SECONDS = 1.0
+
+def token_batches(texts, max_tokens=EMBED_BATCH_TOKENS, max_items=EMBED_BATCH_SIZE):
+    """Splits range(len(texts)) into consecutive batches within both budgets.
+    A single text over max_tokens still gets a batch of its own."""
+    batches = []
+    batch, batch_tokens = [], 0
+    # cl100k_base is the encoding text-embedding-3-* models use
+    for index, tokens in enumerate(count_tokens(texts, "cl100k_base")):
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(index)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+async def _embed_batch(embed, texts, semaphore, max_retries):
+    async with semaphore:
+        for attempt in range(max_retries + 1):
+            try:
+                # embed is a blocking client call; run it off the event loop
+                return await asyncio.to_thread(embed, texts)
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                delay = EMBED_BACKOFF_SECONDS * 2 ** attempt * (1 + random.random())
+                logging.warning(f"Embedding batch of {len(texts)} failed ({type(e).__name__}: {e}), "
+                                f"retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+async def embed_texts_async(embed, texts, concurrency=EMBED_CONCURRENCY, max_retries=EMBED_MAX_RETRIES,
+                            max_tokens=EMBED_BATCH_TOKENS, max_items=EMBED_BATCH_SIZE):
+    semaphore = asyncio.Semaphore(concurrency)
+    batches = token_batches(texts, max_tokens, max_items)
+    results = await asyncio.gather(*(
+        _embed_batch(embed, [texts[index] for index in batch], semaphore, max_retries) for batch in batches
+    ))
+    vectors = [None] * len(texts)
+    for batch, batch_vectors in zip(batches, results):
+        for index, vector in zip(batch, batch_vectors):
+            vectors[index] = vector
+    return vectors
+
+def embed_texts(embed, texts, **kwargs):
+    """Embeds `texts` with `embed` (e.g. Embeddings.embed_documents) and returns
+    the vectors in input order. See embed_texts_async for the keyword arguments."""
+    if not texts:
+        return []
+    start = time.perf_counter()
+    vectors = asyncio.run(embed_texts_async(embed, texts, **kwargs))
+    logging.debug(f"Embedded {len(texts)} texts in {time.perf_counter() - start:.2f}s")
+    return vectors
@@ -0,0 +1,124 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+from embeddings import model_key
+
+load_dotenv()
+
+# Lives outside CHROMA_PATH so `populate_database.py --reset` keeps it
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', "./.embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', "200000"))
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """On-disk embedding store keyed by hash(model + text) with LRU eviction."""
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Returns {key: vector} for the keys present in the cache and bumps their recency."""
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        """Stores (key, vector) pairs, then evicts least recently used entries over the limit."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items]
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings object so document embeddings are served from an EmbeddingCache
+    and only cache misses reach the embedding API."""
+    def __init__(self, embeddings, cache=None, model=None):
+        self.embeddings = embeddings
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.model = model or model_key(embeddings)
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.model, text) for text in texts]
+        cached = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        # Embed each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.cache.put_many(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
@@ -7,11 +7,47 @@ load_dotenv()
 
 CHROMA_PATH = os.getenv('CHROMA_PATH')
 CHROMA_COLLECTION = os.getenv('CHROMA_COLLECTION_DESC')
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', "openai")  # or "onnx" for local CPU embeddings
+EMBEDDING_BASE_URL = os.getenv('EMBEDDING_BASE_URL')  # e.g. stub_server.py's http://127.0.0.1:8001/v1; None = OpenAI
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
 
-def get_embedding_function():
-    """Returns an OpenAIEmbeddings object that can be used with Chroma"""
+def get_embedding_function(backend=None):
+    """Returns an Embeddings object that can be used with Chroma"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        from local_embeddings import LocalOnnxEmbeddings
+        return LocalOnnxEmbeddings()
+    if backend != "openai":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r} (expected 'openai' or 'onnx')")
     return OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        openai_api_key=os.getenv('OPENAI_API_KEY')
+        model=OPENAI_EMBEDDING_MODEL,
+        openai_api_key=os.getenv('OPENAI_API_KEY') or ("stub" if EMBEDDING_BASE_URL else None),
+        base_url=EMBEDDING_BASE_URL,
+        # Client-side splitting needs tiktoken's encoding files, which an offline run can't fetch
+        check_embedding_ctx_length=EMBEDDING_BASE_URL is None,
     )
 
+def model_key(embeddings):
+    """The model name, plus the endpoint when it isn't OpenAI's, e.g.
+    `text-embedding-3-small@http://127.0.0.1:8001/v1`, so stub vectors never pass for real ones."""
+    model = getattr(embeddings, "model", type(embeddings).__name__)
+    base_url = getattr(embeddings, "openai_api_base", None)
+    return f"{model}@{base_url}" if base_url else model
+
+def embedder_id(embedding_function):
+    """Identifies the model behind an Embeddings object, e.g. `openai:text-embedding-3-small`.
+    Stored in the collection metadata so a store is never queried with another model's vectors."""
+    embeddings = getattr(embedding_function, "embeddings", embedding_function)  # unwrap CachedEmbeddings
+    backend = "onnx" if type(embeddings).__name__ == "LocalOnnxEmbeddings" else "openai"
+    return f"{backend}:{model_key(embeddings)}"
+
+def check_embedder(collection_metadata, embedding_function, name):
+    """Raises ValueError if the collection records a different embedder than embedding_function."""
+    recorded = (collection_metadata or {}).get("embedder")
+    current = embedder_id(embedding_function)
+    if recorded and recorded != current:
+        raise embedder_mismatch(name, recorded, current)
+
+def embedder_mismatch(name, recorded, current):
+    return ValueError(f"Collection {name} was built with {recorded} but EMBEDDING_BACKEND gives {current}; "
+                      "switch back or rebuild it with populate_database.py --reset")
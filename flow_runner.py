@@ -0,0 +1,78 @@
+import copy
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from pocketflow import BaseNode, Flow
+
+_timings_lock = threading.Lock()
+
+def node_name(node):
+    return getattr(node, "name", None) or type(node).__name__
+
+class FlowCancelled(Exception):
+    """Raised when shared["cancel"] (a threading.Event) is set, e.g. because the HTTP client went away."""
+
+def check_cancelled(shared):
+    cancel = shared.get("cancel")
+    if cancel is not None and cancel.is_set():
+        raise FlowCancelled()
+
+def timed_run(node, shared):
+    """Runs a node and adds its wall time (seconds) to shared["timings"][name].
+    Raises FlowCancelled instead if the flow was cancelled before the node started."""
+    check_cancelled(shared)
+    start = time.perf_counter()
+    try:
+        return node._run(shared)
+    finally:
+        elapsed = time.perf_counter() - start
+        with _timings_lock:
+            timings = shared.setdefault("timings", {})
+            name = node_name(node)
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+class TimedFlow(Flow):
+    """Flow that records per-node wall time in shared["timings"]."""
+    def __init__(self, start, name=None):
+        super().__init__(start)
+        self.name = name
+
+    def get_next_node(self, curr, action):
+        # A branch ending on the default action is a normal end, not a missing transition
+        if (action or "default") == "default" and "default" not in curr.successors:
+            return None
+        return super().get_next_node(curr, action)
+
+    def _orch(self, shared, params=None):
+        curr, p = copy.copy(self.start), (params or {**self.params})
+        while curr:
+            curr.set_params(p)
+            action = timed_run(curr, shared)
+            curr = copy.copy(self.get_next_node(curr, action))
+
+class ParallelNodes(BaseNode):
+    """Runs independent nodes (or sub-flows) concurrently on the same shared store
+    and joins before continuing to its successors.
+
+    Branches must write disjoint keys of `shared`. A branch that needs a
+    sequence of nodes, or a retry loop, should be wrapped in a TimedFlow.
+    """
+    def __init__(self, *nodes, name=None):
+        super().__init__()
+        self.nodes = nodes
+        self.name = name or "+".join(node_name(node) for node in nodes)
+
+    def _run(self, shared):
+        with ThreadPoolExecutor(max_workers=len(self.nodes)) as executor:
+            futures = []
+            for node in self.nodes:
+                node = copy.copy(node)
+                node.set_params(self.params)
+                # Copy the caller's context so LangChain callbacks (e.g. token counting) see every branch
+                context = contextvars.copy_context()
+                futures.append(executor.submit(context.run, timed_run, node, shared))
+            # Wait for every branch; re-raise the first failure
+            for future in futures:
+                future.result()
+        return "default"
@@ -0,0 +1,78 @@
+"""Streams GenerateCode's completion instead of blocking until it is done.
+
+Tokens are echoed to stdout as they arrive (the console, or the cell output
+when the flow runs in a notebook). Each completed statement is linted
+with code_lint.StatementLinter. If a statement has a syntax error or calls a
+method cq.Workplane does not have, the generation is cut off there and the
+partial script goes to LintCode, which sends it back for regeneration. Time
+to first token is reported separately from the total.
+
+Cached responses are returned whole, so for them the TTFT equals the total time.
+"""
+import os
+import sys
+import time
+import logging
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from code_lint import StatementLinter
+from flow_runner import FlowCancelled
+
+load_dotenv()
+
+STREAM_GENERATION = os.getenv('STREAM_GENERATION', "1").lower() in ("1", "true", "yes")
+
+class _StopGeneration(Exception):
+    pass
+
+class _StreamHandler(BaseCallbackHandler):
+    raise_error = True  # let _StopGeneration abort the request
+
+    def __init__(self, echo, linter, cancel=None):
+        self.echo = echo
+        self.linter = linter
+        self.cancel = cancel
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.tokens = []
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.cancel is not None and self.cancel.is_set():
+            raise FlowCancelled()  # closes the stream, so the request stops too
+        if not token:
+            return
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+        self.tokens.append(token)
+        if self.echo:
+            sys.stdout.write(token)
+            sys.stdout.flush()
+        if self.linter is not None and self.linter.feed(token):
+            raise _StopGeneration()
+
+def generate_streaming(model, prompt, echo=True, check=True, cancel=None):
+    """Runs `prompt` through a LangChain chat model, streaming. Returns a dict with `code`, `ttft`
+    and `seconds` (both from the call), `aborted` (stopped at a bad statement) and `problems`.
+    Raises FlowCancelled once `cancel` (a threading.Event) is set."""
+    linter = StatementLinter() if check else None
+    handler = _StreamHandler(echo, linter, cancel)
+    aborted = False
+    try:
+        # stream=True makes invoke() stream through the callbacks and still use the response cache
+        code = model.invoke(prompt, config={"callbacks": [handler]}, stream=True).content.strip()
+    except _StopGeneration:
+        code = "".join(handler.tokens).strip()
+        aborted = True
+    seconds = time.perf_counter() - handler.start
+    if echo and handler.tokens:
+        sys.stdout.write("\n")
+    problems = list(linter.problems) if linter is not None else []
+    if aborted:
+        logging.warning(f"Stopped generation after {seconds:.1f}s: {'; '.join(problems)}")
+    return {
+        "code": code,
+        "ttft": handler.first_token if handler.first_token is not None else seconds,
+        "seconds": seconds,
+        "aborted": aborted,
+        "problems": problems,
+    }
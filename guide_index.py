@@ -0,0 +1,117 @@
+"""The improvement guide, parsed once and kept in memory.
+
+The guide is split into heading-delimited sections (context_builder.split_sections),
+and each section's keywords and embedding are computed when it is loaded.
+Every call checks the file's mtime and reparses it if it changed, so edits
+show up without a restart. Section embeddings go through the embedding
+cache, so a reload only embeds sections whose text changed.
+
+    get_guide_index().score("a mug with a curved handle")  # [(section, score)], document order
+"""
+import os
+import math
+import logging
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from context_builder import split_sections
+from lexical_index import tokenize
+from reranker import term_coverage
+
+load_dotenv()
+
+GUIDE_PATH = os.getenv('GUIDE_PATH', "./documents/cadquery-improvement-guide.md")
+GUIDE_SEMANTIC_WEIGHT = 0.5  # share of a section's score from embedding similarity vs. keyword coverage
+
+_UNLOADED = object()
+
+class GuideIndex:
+    def __init__(self, path=GUIDE_PATH, embedding_function=None):
+        self.path = path
+        self._embedding_function = embedding_function
+        self._lock = threading.Lock()
+        self._mtime = _UNLOADED
+        self.sections = []
+        self._terms = []
+        self._idf = {}
+        self._embeddings = None
+
+    def _embedder(self):
+        if self._embedding_function is None:
+            from embeddings import get_embedding_function
+            from embedding_cache import CachedEmbeddings
+            self._embedding_function = CachedEmbeddings(get_embedding_function())
+        return self._embedding_function
+
+    def refresh(self):
+        """Reparses the guide if its mtime changed since the last load; returns the sections."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                self._load(mtime)
+            return self.sections
+
+    def _load(self, mtime):
+        sections = []
+        if mtime is None:
+            logging.warning(f"No guide at {self.path}, prompts get no guide sections")
+        else:
+            with open(self.path, "r") as file:
+                sections = split_sections(file.read())
+        terms = [set(tokenize(section["title"] + "\n" + section["text"])) for section in sections]
+        frequency = {}
+        for section_terms in terms:
+            for term in section_terms:
+                frequency[term] = frequency.get(term, 0) + 1
+
+        embeddings = None
+        if sections:
+            try:
+                vectors = np.asarray(self._embedder().embed_documents([section["text"] for section in sections]),
+                                     dtype=np.float32)
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                embeddings = vectors / np.where(norms == 0, 1, norms)
+            except Exception as e:
+                logging.warning(f"Could not embed guide sections, selecting by keywords only: {e}")
+
+        self.sections, self._terms, self._embeddings = sections, terms, embeddings
+        self._idf = {term: math.log(1 + len(sections) / (count + 0.5)) for term, count in frequency.items()}
+        self._mtime = mtime
+        logging.info(f"Loaded {len(sections)} guide sections from {self.path}")
+
+    def score(self, query, query_embedding=None):
+        """[(section, relevance in 0..1)] for every section, in document order. Blends IDF-weighted
+        keyword coverage with cosine similarity to `query_embedding` (embedded here if None)."""
+        self.refresh()
+        with self._lock:
+            sections, terms, idf, embeddings = self.sections, self._terms, self._idf, self._embeddings
+        if not sections:
+            return []
+        weights = {term: idf.get(term, math.log(1 + len(sections) / 0.5)) for term in set(tokenize(query))}
+        scores = [term_coverage(weights, section_terms) for section_terms in terms]
+
+        if embeddings is not None:
+            try:
+                if query_embedding is None:
+                    query_embedding = self._embedder().embed_query(query)
+                vector = np.asarray(query_embedding, dtype=np.float32)
+                similarities = embeddings @ (vector / (np.linalg.norm(vector) or 1.0))
+                scores = [(1 - GUIDE_SEMANTIC_WEIGHT) * score + GUIDE_SEMANTIC_WEIGHT * max(float(similarity), 0.0)
+                          for score, similarity in zip(scores, similarities)]
+            except Exception as e:
+                logging.warning(f"Could not embed the query for guide selection, using keywords only: {e}")
+        return list(zip(sections, scores))
+
+_guide_index = None
+_guide_index_lock = threading.Lock()
+
+def get_guide_index():
+    """Returns the process-wide GuideIndex, creating it on first call."""
+    global _guide_index
+    with _guide_index_lock:
+        if _guide_index is None:
+            _guide_index = GuideIndex()
+        return _guide_index
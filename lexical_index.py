@@ -0,0 +1,186 @@
+"""BM25 inverted index over the chunks of a Chroma collection.
+
+Embeddings blur exact API identifiers (`twistExtrude`, `parametricCurve`),
+which a keyword index matches directly. populate_database.py rebuilds the
+index after every sync. It is stored as flat NumPy arrays plus two byte
+tables (terms, chunk IDs) and opened with mmap, so loading reads only a few
+small headers and a query touches just the postings of its own terms.
+
+    index = LexicalIndex.open()
+    index.search("twistExtrude a square", k=20)  # [(chunk_id, bm25 score)]
+"""
+import os
+import re
+import json
+import math
+import shutil
+import numpy as np
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LEXICAL_INDEX_PATH = os.getenv('LEXICAL_INDEX_PATH', "./.lexical_index")
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_TERM_LENGTH = 64
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+(?:\.\d+)?")
+CAMEL_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+def tokenize(text):
+    """Lowercased words and identifiers; `twistExtrude` and `make_box` also yield their parts."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        word = match.group()
+        if len(word) > MAX_TERM_LENGTH:
+            continue
+        tokens.append(word.lower())
+        parts = [part for piece in word.split("_") for part in CAMEL_PATTERN.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+class _StringTable:
+    """Strings stored as one UTF-8 blob plus offsets; `find` bisects a sorted table."""
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @staticmethod
+    def pack(strings):
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(item) for item in encoded])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _bytes(self, index):
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes()
+
+    def __getitem__(self, index):
+        return self._bytes(index).decode("utf-8")
+
+    def find(self, string):
+        target = string.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self) and self._bytes(low) == target else -1
+
+def build_index(ids, documents, path=LEXICAL_INDEX_PATH, collection_name=None):
+    """Writes the index for `documents` (chunk texts, parallel to `ids`) to `path`."""
+    postings = {}
+    doc_lengths = np.zeros(len(ids), dtype=np.int32)
+    for doc_index, text in enumerate(documents):
+        counts = Counter(tokenize(text or ""))
+        doc_lengths[doc_index] = sum(counts.values())
+        for term, count in counts.items():
+            postings.setdefault(term, []).append((doc_index, count))
+
+    # Sorted by UTF-8 bytes, the order _StringTable.find bisects in
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+    posting_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    posting_offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+    posting_docs = np.empty(posting_offsets[-1], dtype=np.int32)
+    posting_tfs = np.empty(posting_offsets[-1], dtype=np.uint16)
+    for term_index, term in enumerate(terms):
+        start, stop = posting_offsets[term_index], posting_offsets[term_index + 1]
+        entries = np.asarray(postings[term], dtype=np.int64)
+        posting_docs[start:stop] = entries[:, 0]
+        posting_tfs[start:stop] = np.minimum(entries[:, 1], np.iinfo(np.uint16).max)
+
+    term_blob, term_offsets = _StringTable.pack(terms)
+    id_blob, id_offsets = _StringTable.pack(ids)
+    arrays = {
+        "terms": term_blob, "term_offsets": term_offsets,
+        "ids": id_blob, "id_offsets": id_offsets,
+        "posting_offsets": posting_offsets, "posting_docs": posting_docs, "posting_tfs": posting_tfs,
+        "doc_lengths": doc_lengths,
+    }
+    meta = {
+        "collection": collection_name,
+        "documents": len(ids),
+        "terms": len(terms),
+        "avg_doc_length": float(doc_lengths.mean()) if len(ids) else 0.0,
+    }
+
+    # Write next to the live index and swap it in, so readers never see a half-written one
+    tmp_path = path.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as file:
+        json.dump(meta, file)
+    old_path = path.rstrip("/") + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return meta
+
+class LexicalIndex:
+    def __init__(self, path, meta, arrays):
+        self.path = path
+        self.meta = meta
+        self.collection_name = meta.get("collection")
+        self._terms = _StringTable(arrays["terms"], arrays["term_offsets"])
+        self._ids = _StringTable(arrays["ids"], arrays["id_offsets"])
+        self._posting_offsets = arrays["posting_offsets"]
+        self._posting_docs = arrays["posting_docs"]
+        self._posting_tfs = arrays["posting_tfs"]
+        self._doc_lengths = arrays["doc_lengths"]
+
+    @classmethod
+    def open(cls, path=LEXICAL_INDEX_PATH):
+        """Memory-maps the index at `path`; returns None if there is none."""
+        try:
+            with open(os.path.join(path, "meta.json"), "r") as file:
+                meta = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        names = ["terms", "term_offsets", "ids", "id_offsets",
+                 "posting_offsets", "posting_docs", "posting_tfs", "doc_lengths"]
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in names}
+        return cls(path, meta, arrays)
+
+    def __len__(self):
+        return self.meta["documents"]
+
+    def idf(self, term):
+        """BM25 inverse document frequency of `term` (highest for terms no chunk contains)."""
+        term_index = self._terms.find(term)
+        frequency = 0 if term_index < 0 else int(self._posting_offsets[term_index + 1] - self._posting_offsets[term_index])
+        return math.log(1 + (self.meta["documents"] - frequency + 0.5) / (frequency + 0.5))
+
+    def search(self, query, k=20):
+        """Returns up to k (chunk_id, bm25 score) pairs, best first."""
+        documents = self.meta["documents"]
+        if not documents:
+            return []
+        scores = np.zeros(documents, dtype=np.float32)
+        avg_length = self.meta["avg_doc_length"] or 1.0
+        for term in set(tokenize(query)):
+            term_index = self._terms.find(term)
+            if term_index < 0:
+                continue
+            start, stop = self._posting_offsets[term_index], self._posting_offsets[term_index + 1]
+            docs = self._posting_docs[start:stop]
+            tfs = self._posting_tfs[start:stop].astype(np.float32)
+            idf = math.log(1 + (documents - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[docs] / avg_length)
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self._ids[int(doc)], float(scores[doc])) for doc in matched]
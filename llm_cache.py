@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', "./.llm_cache.sqlite3")
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))  # seconds, <= 0 never expires
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', "5000"))
+# Set LLM_CACHE_BYPASS=1 to always call the model (e.g. to measure real latency)
+LLM_CACHE_BYPASS = os.getenv('LLM_CACHE_BYPASS', "").lower() in ("1", "true", "yes")
+
+class ResponseCache(BaseCache):
+    """Exact-match LLM response cache in SQLite, keyed by the model settings and the rendered prompt.
+
+    LangChain passes the model name, reasoning_effort and other settings as
+    `llm_string`, so a prompt cached for one model never answers another.
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted past `max_entries`.
+    """
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, generations TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generations, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl > 0 and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        generations = json.dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, generations, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, generations, now, now)
+            )
+            if self.ttl > 0:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Returns the process-wide ResponseCache shared by every node, creating it on first call."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
@@ -0,0 +1,116 @@
+"""Sentence embeddings computed on the CPU with onnxruntime.
+
+By default this is all-MiniLM-L6-v2, the ONNX export Chroma downloads to
+~/.cache/chroma/onnx_models (fetched on first use). LOCAL_EMBEDDING_MODEL_DIR
+can point at any directory holding a BERT-style `model.onnx` and its
+`tokenizer.json`.
+
+Inputs are sorted by length and padded per batch rather than to the maximum
+length. The tokenizer and session are loaded on first use and kept for the
+life of the process (nothing but the downloaded model is stored on disk),
+and query embeddings are kept in an in-memory LRU.
+tests/test_local_embeddings.py compares the vectors with sentence-transformers'
+output for the same model.
+"""
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "chroma", "onnx_models", "all-MiniLM-L6-v2", "onnx")
+LOCAL_EMBEDDING_MODEL_DIR = os.getenv('LOCAL_EMBEDDING_MODEL_DIR', DEFAULT_MODEL_DIR)
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv('LOCAL_EMBEDDING_BATCH_SIZE', "32"))
+LOCAL_EMBEDDING_QUERY_CACHE = int(os.getenv('LOCAL_EMBEDDING_QUERY_CACHE', "1024"))
+MAX_SEQUENCE_LENGTH = 256  # what sentence-transformers uses for MiniLM
+
+_models = {}
+_models_lock = threading.Lock()
+
+def load_model(model_dir):
+    """(tokenizer, session) for model_dir, loaded on the first call and reused for the rest of the process."""
+    with _models_lock:
+        if model_dir not in _models:
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            if model_dir == DEFAULT_MODEL_DIR and not os.path.exists(os.path.join(model_dir, "model.onnx")):
+                from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+                ONNXMiniLM_L6_V2()._download_model_if_not_exists()
+
+            tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=MAX_SEQUENCE_LENGTH)
+            tokenizer.no_padding()
+            options = onnxruntime.SessionOptions()
+            options.log_severity_level = 3
+            session = onnxruntime.InferenceSession(
+                os.path.join(model_dir, "model.onnx"), sess_options=options, providers=["CPUExecutionProvider"]
+            )
+            _models[model_dir] = (tokenizer, session)
+        return _models[model_dir]
+
+def model_name(model_dir):
+    # .../all-MiniLM-L6-v2/onnx -> all-MiniLM-L6-v2
+    path = os.path.normpath(model_dir)
+    name = os.path.basename(path)
+    return os.path.basename(os.path.dirname(path)) if name == "onnx" else name
+
+class LocalOnnxEmbeddings(Embeddings):
+    def __init__(self, model_dir=LOCAL_EMBEDDING_MODEL_DIR, batch_size=LOCAL_EMBEDDING_BATCH_SIZE,
+                 query_cache_size=LOCAL_EMBEDDING_QUERY_CACHE):
+        self.model_dir = model_dir
+        self.model = model_name(model_dir)
+        self.batch_size = batch_size
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+
+    def _embed(self, texts):
+        tokenizer, session = load_model(self.model_dir)
+        input_names = {model_input.name for model_input in session.get_inputs()}
+        encodings = tokenizer.encode_batch(texts)
+        vectors = np.zeros((len(texts), 0), dtype=np.float32)
+
+        # Similar lengths share a batch, so little of each batch is padding
+        order = sorted(range(len(texts)), key=lambda index: len(encodings[index].ids))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            width = max(len(encodings[index].ids) for index in batch)
+            input_ids = np.zeros((len(batch), width), dtype=np.int64)
+            attention_mask = np.zeros((len(batch), width), dtype=np.int64)
+            for row, index in enumerate(batch):
+                ids = encodings[index].ids
+                input_ids[row, :len(ids)] = ids
+                attention_mask[row, :len(ids)] = 1
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask,
+                      "token_type_ids": np.zeros_like(input_ids)}
+            hidden = session.run(None, {name: value for name, value in inputs.items() if name in input_names})[0]
+
+            # Mean over real tokens, then L2-normalise
+            mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            if not vectors.shape[1]:
+                vectors = np.zeros((len(texts), pooled.shape[1]), dtype=np.float32)
+            vectors[batch] = pooled
+        return vectors
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._embed(list(texts)).tolist()
+
+    def embed_query(self, text):
+        with self._query_cache_lock:
+            if text in self._query_cache:
+                self._query_cache.move_to_end(text)
+                return list(self._query_cache[text])
+        vector = self._embed([text])[0].tolist()
+        with self._query_cache_lock:
+            self._query_cache[text] = vector
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return list(vector)
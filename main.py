@@ -1,13 +1,24 @@
 import os
+import time
 import logging
+import threading
 from openai import OpenAI
-from langchain_chroma import Chroma
 from langchain.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
-from embeddings import get_embedding_function
-from pathlib import Path
+from retriever import get_retriever
+from reranker import rerank, RERANK_CANDIDATES, RERANK_TOP_N
+from llm_cache import get_response_cache, LLM_CACHE_BYPASS
+from semantic_cache import get_semantic_cache, SEMANTIC_CACHE_BYPASS
+from results_log import append_result, compact_to_notebook
+from code_validator import validate_code
+from code_lint import lint_code
+from generation_stream import generate_streaming, STREAM_GENERATION
+from context_builder import build_context
+from guide_index import get_guide_index
+from worker_pool import get_worker_pool
 
-from pocketflow import Node, Flow
+from pocketflow import Node
+from flow_runner import TimedFlow, ParallelNodes, FlowCancelled
 from langchain_openai import ChatOpenAI
 
 load_dotenv()
@@ -15,6 +26,26 @@ CHROMA_PATH = os.getenv('CHROMA_PATH')
 CHROMA_COLLECTION = os.getenv('CHROMA_COLLECTION_DESC')
 FILE_PATH = os.getenv('FILE_PATH')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+MAX_GENERATION_ATTEMPTS = int(os.getenv('MAX_GENERATION_ATTEMPTS', "3"))
+LLM_BASE_URL = os.getenv('LLM_BASE_URL')  # e.g. stub_server.py's http://127.0.0.1:8001/v1; None = OpenAI
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', "8"))  # model requests in flight across all threads
+_llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+
+FEW_SHOT_EXAMPLES = [
+    """Request: Create a cylinder with a 1-inch diameter and 2-inch height.
+Output:
+import cadquery as cq
+result = cq.Workplane("XY").circle(0.5).extrude(2)
+display(result)""",
+    """Request: Create a nut with a 1/2 inch diameter.
+Output:
+import cadquery as cq
+diameter = 0.5
+height = 0.25
+result = (cq.Workplane("XY").circle(diameter / 2).extrude(height)
+          .faces("<Z").workplane().hole(diameter / 4))
+display(result)""",
+]
 
 PROMPT_TEMPLATE = """
 You are an expert in CadQuery and Python. Given the following context, generate **only** valid, functional CadQuery code that follows best practices. Ensure the code does not contain syntax errors and is executable.
@@ -52,123 +83,139 @@ logging.basicConfig(level=logging.INFO)
 # Set up OpenAI API key
 OpenAI.api_key = OPENAI_API_KEY
 
+class BoundedChatOpenAI(ChatOpenAI):
+    """ChatOpenAI that holds one of LLM_CONCURRENCY slots while a request is in flight.
+    Cache hits are answered before _generate/_stream, so they never wait for a slot."""
+    def _generate(self, *args, **kwargs):
+        with _llm_slots:
+            return super()._generate(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        with _llm_slots:
+            yield from super()._stream(*args, **kwargs)
+
+_models = {}
+_models_lock = threading.Lock()
+
 # Define a reusable model creator function
-def get_openai_model(temperature=0.2):
-    return ChatOpenAI(
-        model="o3-mini",
-        openai_api_key=os.getenv('OPENAI_API_KEY'),
-        reasoning_effort="medium",
-    )
+def get_openai_model(temperature=0.2, use_cache=True):
+    # One client per cache setting, shared by every node, thread and request, so its connections stay warm.
+    # o3-mini takes no temperature; the argument only documents the intent of each call site.
+    # Identical (model, reasoning_effort, prompt) calls are answered from the local response cache
+    use_cache = use_cache and not LLM_CACHE_BYPASS
+    with _models_lock:
+        if use_cache not in _models:
+            _models[use_cache] = BoundedChatOpenAI(
+                model="o3-mini",
+                openai_api_key=os.getenv('OPENAI_API_KEY') or ("stub" if LLM_BASE_URL else None),
+                base_url=LLM_BASE_URL,
+                reasoning_effort="medium",
+                stream_usage=True,  # token counts for streamed generations too
+                cache=get_response_cache() if use_cache else False,
+            )
+        return _models[use_cache]
 
 class RetrieveContext(Node):
     def prep(self, shared):
         return shared["query"]
     
     def exec(self, query):
-        # Get the embedding object
-        embedding_function = get_embedding_function()
-
-        # Use it with Chroma
-        vector_store = Chroma(
-            persist_directory=CHROMA_PATH,
-            collection_name=CHROMA_COLLECTION,
-            embedding_function=embedding_function
-        )
+        # Shared retriever: the Chroma collection, embedding client and BM25 index stay open between queries.
+        # Vector and keyword rankings are fused, best first; RerankContext narrows them down.
+        return get_retriever().hybrid_search(query, k=RERANK_CANDIDATES, candidates=RERANK_CANDIDATES)
+    
+    def post(self, shared, prep_res, exec_res):
+        shared["candidates"] = exec_res
+        return "default"
 
-        # When performing similarity search, pass the query as a string
-        results = vector_store.similarity_search_with_score(query, k=5)
-        return sorted(results, key=lambda x: x[1], reverse=True)
+class RerankContext(Node):
+    def prep(self, shared):
+        return shared["query"], shared["candidates"]
+    
+    def exec(self, inputs):
+        query, candidates = inputs
+        start = time.perf_counter()
+        # Lexical relevance + MMR, no model call
+        results = rerank(query, candidates, top_n=RERANK_TOP_N, idf=get_retriever().idf)
+        return results, time.perf_counter() - start
     
     def post(self, shared, prep_res, exec_res):
-        context_text = self._build_base_context()
-        for chunk in exec_res:
-            context_text += "\n\n---\n\n" + chunk[0].page_content
-        shared["context"] = context_text
-        shared["sources"] = [chunk[0].metadata.get("id", None) for chunk in exec_res]
+        results, seconds = exec_res
+        logging.info(f"Reranked {len(prep_res[1])} candidates to {len(results)} in {seconds * 1000:.1f} ms")
+        shared["rerank"] = {"candidates": len(prep_res[1]), "selected": len(results), "ms": seconds * 1000}
+        shared["retrieved"] = results
+        shared["context"] = "\n\n---\n\n".join(chunk[0].page_content for chunk in results)
+        shared["sources"] = [chunk[0].metadata.get("id", None) for chunk in results]
         return "default"
 
-    def _build_base_context(self):
-        return """
-        ---
-        Example 1:
-        Request: Create a cylinder with a 1-inch diameter and 2-inch height.
-        Output:
-        import cadquery as cq
-        result = cq.Workplane("XY").cylinder("2", 0.5, centered=(True, True, False))
-        ---
-
-        Example 2:
-        Request: Create a nut with a 1/2 inch diameter.
-        Output:
-        import cadquery as cq
-        diameter = 0.5
-        height = 0.25
-        result = cq.Workplane("XY").circle(diameter / 2).extrude(height)
-        .faces("<Z").workplane().hole(diameter / 4)
-        ---
-        """
+class SelectGuideSections(Node):
+    def prep(self, shared):
+        # Reuse the semantic cache's embedding of the query when there is one
+        return shared["query"], shared.get("query_embedding")
 
-class GenerateCode(Node):
-    guidelines_path = Path("./documents/cadquery-improvement-guide.md")
-    def load_context_from_file(self, file_path):
-        try:
-            with open(file_path, "r") as file:
-                return file.read()
-        except Exception as e:
-            print(f"Error loading context file: {e}")
-            return "No guidelines available."
+    def exec(self, inputs):
+        query, query_embedding = inputs
+        # Parsed and embedded once; reloaded only when the guide file changes
+        return get_guide_index().score(query, query_embedding)
+
+    def post(self, shared, prep_res, exec_res):
+        shared["guide_sections"] = exec_res
+        return "default"
 
+class GenerateCode(Node):
     def prep(self, shared):
         prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-        return prompt_template.format(
-            context=self.load_context_from_file(self.guidelines_path), 
-            question=shared["query"]
+        question = shared["query"]
+        verification = shared.get("code_verification")
+        if verification and not verification["valid"]:
+            # Regenerating after a failed validation: show the model what went wrong
+            question += (
+                f"\n\nA previous attempt failed validation ({verification['stage']}): {verification['error']}"
+                f"\nPrevious code:\n{shared['code_response']}\nFix the problem."
+            )
+        # Only the guide sections, examples and chunks that are worth their tokens for this query
+        guide_sections = shared.get("guide_sections", [])
+        context, report = build_context(
+            shared["query"],
+            chunks=shared.get("retrieved", []),
+            guide_sections=[section for section, _ in guide_sections],
+            section_scores=[score for _, score in guide_sections],
+            examples=FEW_SHOT_EXAMPLES,
         )
+        prompt = prompt_template.format(context=context, question=question)
+        return prompt, report, shared.get("echo", True), shared.get("cancel")
     
-    def exec(self, prompt):
+    def exec(self, inputs):
+        prompt, _, echo, cancel = inputs
         model = get_openai_model(temperature=0.2)
+        if STREAM_GENERATION:
+            # Tokens are shown as they arrive; a statement that can't be fixed stops the generation early
+            return generate_streaming(model, prompt, echo=echo, cancel=cancel)
+        start = time.perf_counter()
         response = model.invoke(prompt)
-        return response.content.strip()
+        seconds = time.perf_counter() - start
+        return {"code": response.content.strip(), "ttft": seconds, "seconds": seconds, "aborted": False, "problems": []}
     
     def post(self, shared, prep_res, exec_res):
-        shared["code_response"] = exec_res
+        report = prep_res[1]
+        logging.info(f"Prompt context: {report['tokens']}/{report['budget']} tokens, {report['guides']} guide sections, "
+                     f"{report['examples']} examples, {report['chunks']} chunks")
+        logging.info(f"Generation: first token after {exec_res['ttft']:.2f}s, done after {exec_res['seconds']:.2f}s"
+                     + (" (stopped early)" if exec_res["aborted"] else ""))
+        shared["context_report"] = report
+        shared["generation"] = {key: value for key, value in exec_res.items() if key != "code"}
+        shared["code_response"] = exec_res["code"]
+        shared["generation_attempts"] = shared.get("generation_attempts", 0) + 1
         return "default"
 
 class SaveToNotebook(Node):
     def prep(self, shared):
-        return shared["query"], shared["code_response"]
+        return shared["query"], shared["code_response"], shared.get("sources", []), shared.get("timings", {})
     
     def exec(self, inputs):
-        import os
-        import nbformat as nbf
-        
-        query_text, code_response = inputs
-        notebook_dir = "./query"
-        notebook_filename = os.path.join(notebook_dir, "result.ipynb")
-        code_response_py = code_response.replace("```python","").replace("```","").strip()
-        
-        # Create directory if it doesn't exist
-        os.makedirs(notebook_dir, exist_ok=True)
-        
-        # Create a new notebook if it doesn't exist
-        if not os.path.exists(notebook_filename):
-            nb = nbf.v4.new_notebook()
-        else:
-            try:
-                with open(notebook_filename, "r") as f:
-                    nb = nbf.read(f, as_version=4)
-            except:
-                # If file exists but is corrupted/empty, create a new notebook
-                nb = nbf.v4.new_notebook()
-        
-        new_code = "###"+query_text.replace("\n","\n##")+"\n"+code_response_py
-        new_code_cell = nbf.v4.new_code_cell(new_code)
-        if "id" in new_code_cell:
-            del new_code_cell["id"]
-        nb.cells.append(new_code_cell)
-        
-        with open(notebook_filename, "w") as f:
-            nbf.write(nb, f)
+        # O(1) append to query/results.jsonl; compact_to_notebook() turns it into query/result.ipynb
+        query_text, code_response, sources, timings = inputs
+        append_result(query_text, code_response, sources, dict(timings))
         return True
     
     def post(self, shared, prep_res, exec_res):
@@ -217,51 +264,123 @@ class AnalyzeQuery(Node):
         shared["query_type"] = exec_res
         return "default"
 
+class LintCode(Node):
+    def prep(self, shared):
+        return shared["code_response"]
+    
+    def exec(self, code_response):
+        # Static checks only: forbidden calls, undefined names, unknown Workplane methods
+        return lint_code(code_response)
+    
+    def post(self, shared, prep_res, exec_res):
+        shared["code_lint"] = exec_res
+        if exec_res["fixes"]:
+            logging.info(f"Lint fixed: {', '.join(exec_res['fixes'])}")
+            shared["code_response"] = exec_res["code"]
+        if exec_res["valid"]:
+            return "default"
+        logging.warning(f"Code lint failed ({exec_res['stage']}): {exec_res['error']}")
+        if shared.get("generation_attempts", 0) < MAX_GENERATION_ATTEMPTS:
+            # Same feedback path as a failed verification, without running anything
+            shared["code_verification"] = exec_res
+            return "invalid_code"
+        return "default"
+
 class VerifyCode(Node):
     def prep(self, shared):
         return shared["code_response"]
     
     def exec(self, code_response):
-        model = get_openai_model(temperature=0.0)  # Lower temperature for verification
-        verification = model.invoke(f"Verify the validity of the following CadQuery code:\n\n{code_response}")
-        return verification.content
+        # Run the script in a warm, resource-limited worker instead of asking the LLM
+        return validate_code(code_response, pool=get_worker_pool())
     
     def post(self, shared, prep_res, exec_res):
         shared["code_verification"] = exec_res
+        if exec_res["valid"]:
+            logging.info(f"Code verified: {exec_res['solids']} solid(s), volume {exec_res['volume']:.3f}")
+            return "default"
+        logging.warning(f"Code verification failed ({exec_res['stage']}): {exec_res['error']}")
+        # Only a real failure of the script is worth another generation
+        if exec_res["stage"] != "environment" and shared.get("generation_attempts", 0) < MAX_GENERATION_ATTEMPTS:
+            return "invalid_code"
         return "default"
 
 def create_cadquery_flow():
     # Create nodes
     retrieve = RetrieveContext()
+    rerank_context = RerankContext()  # Narrow the candidates down to what goes into the prompt
     analyze = AnalyzeQuery()         # New node to analyze query type
     decompose = DecomposeTask()      # New node to break down complex tasks
     evaluate = EvaluateContext()     # New node to evaluate context quality
+    select_guide = SelectGuideSections()  # Guide sections relevant to the query
     generate = GenerateCode()
+    lint = LintCode()                # Static pre-check before running the code
     verify = VerifyCode()            # New node to check code validity
     save = SaveToNotebook()
     
+    # Retrieval and its evaluation form one branch so the retry loop stays inside it
+    retrieve >> rerank_context >> evaluate
+    evaluate - "insufficient_context" >> retrieve  # Loop back if context is poor
+    retrieval = TimedFlow(start=retrieve, name="RetrieveAndEvaluate")
+
+    # Analysis, decomposition, retrieval and guide selection only depend on shared["query"]: run them concurrently
+    prepare = ParallelNodes(analyze, decompose, retrieval, select_guide, name="Prepare")
+
     # Connect nodes with branching logic
-    analyze >> decompose >> retrieve >> evaluate >> generate >> verify >> save
+    prepare >> generate >> lint >> verify >> save
     
     # Add error handling paths
-    evaluate - "insufficient_context" >> retrieve  # Loop back if context is poor
+    lint - "invalid_code" >> generate              # Regenerate if the code fails static checks
     verify - "invalid_code" >> generate            # Regenerate if code is invalid
     
-    return Flow(start=analyze)
+    return TimedFlow(start=prepare)
 
-def query_rag(query_text: str):
+def query_rag(query_text: str, use_semantic_cache=True, echo=True, cancel=None):
+    # echo: print generated tokens as they stream in (off for concurrent batch runs)
+    # cancel: threading.Event; once set, the flow stops at the next node or generated token
+    shared = {"query": query_text, "echo": echo, "cancel": cancel}
+    use_semantic_cache = use_semantic_cache and not SEMANTIC_CACHE_BYPASS
     try:
+        embedding = None
+        if use_semantic_cache:
+            # Near-duplicate of an answered query: reuse its code without running the flow
+            start = time.perf_counter()
+            entry, embedding = get_semantic_cache().lookup(query_text.strip())
+            shared["timings"] = {"SemanticCache": time.perf_counter() - start}
+            if embedding is not None:
+                shared["query_embedding"] = embedding
+            if entry is not None:
+                shared["code_response"] = entry["code_response"]
+                shared["sources"] = entry["sources"]
+                shared["semantic_cache_hit"] = {"query": entry["query"], "similarity": entry["similarity"]}
+                logging.info(f"Semantic cache hit ({entry['similarity']:.3f}) for: {entry['query']}")
+                logging.info(f"\n\n\033[32mResponse: {shared['code_response']}\033[0m\n\nSources: {shared['sources']}]")
+                return shared
+
         flow = create_cadquery_flow()
-        shared = {"query": query_text}
         flow.run(shared)
+
+        verification = shared.get("code_verification") or {}
+        failed_validation = not verification.get("valid", True) and verification.get("stage") != "environment"
+        if use_semantic_cache and shared.get("code_response") and not failed_validation:
+            get_semantic_cache().add(query_text.strip(), shared["code_response"], shared.get("sources", []), embedding)
+    except FlowCancelled:
+        logging.info("Query cancelled")
+        shared["error"] = "cancelled"
     except Exception as e:
         logging.error(f"An error occurred: {e}")
+        shared["error"] = str(e)
+    timings = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in shared.get("timings", {}).items())
+    logging.info(f"Node timings: {timings}")
+    return shared
 
 def main():
+    get_guide_index().refresh()  # Parse and embed the guide before the first query needs it
     query_text = """
 Generate a cloud
     """
     query_rag(query_text)
+    compact_to_notebook()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
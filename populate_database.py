@@ -2,18 +2,14 @@ import argparse
 import os
 import shutil
 import re
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema.document import Document
-from langchain_chroma import Chroma
-import chromadb
-from embeddings import get_embedding_function
+import json
+import time
+import hashlib
 from dotenv import load_dotenv
-import re
-import pymupdf as fitz
+from vector_store import CHROMA_PATH
 
-from langchain_community.document_loaders.generic import GenericLoader
-from langchain_community.document_loaders.parsers import LanguageParser
-from langchain_text_splitters import Language
+# langchain, chromadb and pymupdf are imported inside the functions that use
+# them, so a sync with nothing to do returns without paying their import cost.
 
 load_dotenv()
 
@@ -22,7 +18,16 @@ load_dotenv()
 FILE_PATH = "./documents/"
 CHROMA_COLLECTION_CODE = os.getenv('CHROMA_COLLECTION_CODE')
 CHROMA_COLLECTION_DESC = os.getenv('CHROMA_COLLECTION_DESC')
-CHROMA_PATH = os.getenv('CHROMA_PATH')
+MANIFEST_PATH = os.getenv('INGEST_MANIFEST_PATH', "./.ingest_manifest.json")
+LEXICAL_INDEX_PATH = os.getenv('LEXICAL_INDEX_PATH', "./.lexical_index")
+VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH', "./.vector_index")
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Python sources are only indexed from these directories (not recursively)
+CODE_DIRECTORIES = ["cadquery-contrib/", "cq-warehouse/"]
+QUERY_CODE_DIRECTORY = "./query"
 
 # Ensure USER_AGENT is set
 if 'USER_AGENT' not in os.environ:
@@ -33,54 +38,82 @@ def main():
     # Check if the database should be cleared (using the --reset flag).
     parser = argparse.ArgumentParser()
     parser.add_argument("--reset", action="store_true", help="Reset the database.")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the manifest and re-parse every file, reconciling the collection with it.")
     args = parser.parse_args()
     if args.reset:
         print("✨ Clearing Database")
         clear_database()
     
-    # Load documents
     print(f"File path is: {FILE_PATH}")
-    pages = load_documents(FILE_PATH)
-    
-    # Split documents into code and descriptions
-    split_docs = split_with_overlap(pages, 1000, 200)
-    
-    # Add to Chroma
-    add_to_chroma(split_docs, CHROMA_COLLECTION_DESC)
+    start = time.perf_counter()
+    sync_database(FILE_PATH, CHROMA_COLLECTION_DESC, full=args.full)
+    print(f"⏱️  Sync finished in {time.perf_counter() - start:.2f}s")
+
+def extract_page_blocks(file_path, start_page, stop_page):
+    """Returns the stripped text of every block on pages [start_page, stop_page), one list per page.
+    Opens the document itself so it can run in a worker process."""
+    import pymupdf as fitz
+
+    with fitz.open(file_path) as doc:
+        return [
+            [block[4].strip() for block in doc[page_num].get_text("blocks")]  # Extract structured text blocks
+            for page_num in range(start_page, stop_page)
+        ]
+
+def extract_and_merge_blocks(file_path, workers=None):
+    import pymupdf as fitz
+
+    workers = workers or PDF_WORKERS
+    with fitz.open(file_path) as doc:
+        page_count = len(doc)
+
+    if workers > 1 and page_count > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Several small contiguous ranges per worker so uneven pages balance out
+        step = max(1, -(-page_count // (workers * 4)))
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(extract_page_blocks, file_path, start, stop) for start, stop in ranges]
+            pages = [page for future in futures for page in future.result()]
+    else:
+        pages = extract_page_blocks(file_path, 0, page_count)
+
+    return merge_blocks(file_path, pages)
+
+def merge_blocks(file_path, pages):
+    """Merges description blocks into the code block that follows them, across page boundaries."""
+    from langchain_core.documents import Document
 
-def extract_and_merge_blocks(file_path):
-    doc = fitz.open(file_path)
     merged_chunks = []
-    buffer = ""  # Store temporary text for merging
+    buffer = []  # Store temporary text for merging, joined with blank lines
     metadata = {}
 
-    for page_num in range(len(doc)):
-        blocks = doc[page_num].get_text("blocks")  # Extract structured text blocks
-        
-        for block in blocks:
-            text = block[4].strip()  # Extract text content
+    for page_num, blocks in enumerate(pages):
+        for text in blocks:
             metadata = {"page": page_num + 1, "source": file_path}
 
             if is_code_block(text):  
                 # Merge buffer (previous text) with code
                 if buffer:
                     merged_chunks.append(Document(
-                        page_content=buffer + "\n\n" + text,  # Merge description with code
+                        page_content="\n\n".join(buffer + [text]),  # Merge description with code
                         metadata=metadata
                     ))
-                    buffer = ""  # Reset buffer
+                    buffer = []  # Reset buffer
                 else:
                     merged_chunks.append(Document(page_content=text, metadata=metadata))
             else:
                 # Store description text in buffer for potential merging
                 if buffer:
-                    buffer += "\n\n" + text
-                else:
-                    buffer = text
+                    buffer.append(text)
+                elif text:
+                    buffer = [text]
     
     # Add remaining buffer content if it wasn't merged
     if buffer:
-        merged_chunks.append(Document(page_content=buffer, metadata=metadata))
+        merged_chunks.append(Document(page_content="\n\n".join(buffer), metadata=metadata))
 
     return merged_chunks
 
@@ -88,78 +121,145 @@ def is_code_block(text):
     """Detects if a text block is a code block (fenced or indented)."""
     return bool(re.match(r"(?s)(```.*?```|(?:^\s{4}.*(?:\n|\r))+)", text))
 
-def load_documents(directory_path):
-    def load_language_documents(directory):
+def list_source_files(directory_path):
+    """Returns the paths load_documents indexes: .md/.pdf anywhere under directory_path,
+    .py only directly inside the code example directories."""
+    supported_extensions = ['.md', '.pdf']
+    file_paths = []
+
+    for root, dirs, files in os.walk(directory_path):
+        for filename in files:
+            file_path = os.path.join(root, filename)
+            if os.path.isfile(file_path) and any(filename.endswith(ext) for ext in supported_extensions):
+                file_paths.append(file_path)
+
+    code_directories = [directory_path + code_dir for code_dir in CODE_DIRECTORIES] + [QUERY_CODE_DIRECTORY]
+    for directory in code_directories:
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            file_path = os.path.join(directory, filename)
+            if os.path.isfile(file_path) and filename.endswith('.py'):
+                file_paths.append(file_path)
+
+    return file_paths
+
+def load_file(file_path):
+    """Parses a single source file into documents."""
+    from langchain_core.documents import Document
+
+    if file_path.endswith('.md'):
+        with open(file_path, 'r') as file:
+            content = file.read()
+        return [Document(page_content=content, metadata={"source": file_path})]
+    elif file_path.endswith('.pdf'):
+        return extract_and_merge_blocks(file_path)
+    elif file_path.endswith('.py'):
+        from langchain_community.document_loaders.generic import GenericLoader
+        from langchain_community.document_loaders.parsers import LanguageParser
+        from langchain_text_splitters import Language
+
         loader = GenericLoader.from_filesystem(
-                directory,
-                glob='*',
-                suffixes=['.py'],
+                file_path,
                 parser=LanguageParser(Language.PYTHON)
             )
         return loader.load()
+    return []
 
-    supported_extensions = ['.md', '.pdf']
+def load_documents(directory_path):
     documents = []
     code = [] # For future use, to store code blocks separately from descriptions
 
-    for root, dirs, files in os.walk(directory_path):
-        for filename in files:
-            file_path = os.path.join(root, filename)
-            if os.path.isfile(file_path) and any(filename.endswith(ext) for ext in supported_extensions):
-                print("Loading file:", file_path)
-                if filename.endswith('.md'):
-                    with open(file_path, 'r') as file:
-                        content = file.read()
-                        documents.append(Document(page_content=content, metadata={"source": file_path}))
-                elif filename.endswith('.pdf'):
-                    pages = extract_and_merge_blocks(file_path)
-                    documents.extend(pages)
-    
-    documents.extend(load_language_documents(directory_path + "cadquery-contrib/"))
-    documents.extend(load_language_documents(directory_path + "cq-warehouse/"))
-    documents.extend(load_language_documents("./query"))
+    for file_path in list_source_files(directory_path):
+        print("Loading file:", file_path)
+        documents.extend(load_file(file_path))
     
     if not documents:
         raise ValueError("No supported documents found in the directory. Only .md, .pdf, and .py are supported.")
     
     return documents
 
+FENCE_PATTERN = re.compile(r"^[^\S\n]*```", re.MULTILINE)
+
 def split_with_overlap(docs, chunk_size=500, chunk_overlap=100):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", " ", "```"],  # Preserve paragraph/code grouping and fenced code blocks
-    )
-    
-    split_docs = []
+    """Yields a Document per chunk of each doc, retaining the doc's metadata."""
+    from langchain_core.documents import Document
+
     for doc in docs:
-        chunks = []
-        current_chunk = ""
-        in_code_block = False
+        for chunk in iter_chunks(doc.page_content, chunk_size, chunk_overlap):
+            yield Document(page_content=chunk, metadata=doc.metadata)
 
-        for line in doc.page_content.splitlines(keepends=True):
-            if line.strip().startswith("```"):
-                in_code_block = not in_code_block
+def iter_chunks(text, chunk_size=500, chunk_overlap=100):
+    """Yields chunks of whole lines of at most chunk_size characters.
 
-            if in_code_block:
-                current_chunk += line
-            else:
-                if len(current_chunk) + len(line) > chunk_size:
-                    chunks.append(current_chunk)
-                    current_chunk = line
-                else:
-                    current_chunk += line
+    A fenced code block is never split; one longer than chunk_size becomes its
+    own oversized chunk. Each chunk starts with up to chunk_overlap characters
+    of trailing prose lines from the previous one. Lines are tracked as
+    (start, end) offsets, so the only strings built are the chunks themselves.
+    """
+    buffer = []  # (start, end, is_code) units in the current chunk
+    size = 0
 
-        if current_chunk:
-            chunks.append(current_chunk)
+    for start, end, is_code in iter_line_units(text):
+        length = end - start
+        if buffer and size + length > chunk_size:
+            chunk = text[buffer[0][0]:buffer[-1][1]]
+            if not chunk.isspace():
+                yield chunk
 
-        for chunk in chunks:
-            split_docs.append(Document(
-                page_content=chunk,
-                metadata=doc.metadata  # Retain metadata
-            ))
-    
-    return split_docs
+            # Carry trailing prose lines over, leaving room for the incoming unit
+            keep = len(buffer)
+            overlap = 0
+            while keep > 0 and not buffer[keep - 1][2]:
+                line_length = buffer[keep - 1][1] - buffer[keep - 1][0]
+                if overlap + line_length > chunk_overlap or overlap + line_length + length > chunk_size:
+                    break
+                overlap += line_length
+                keep -= 1
+            buffer = buffer[keep:]
+            size = overlap
+
+        buffer.append((start, end, is_code))
+        size += length
+
+    if buffer:
+        chunk = text[buffer[0][0]:buffer[-1][1]]
+        if not chunk.isspace():
+            yield chunk
+
+def iter_line_units(text):
+    """Yields (start, end, is_code) spans: single lines of prose, or whole fenced code blocks."""
+    length = len(text)
+    position = 0
+    fence_start = None
+
+    # One regex pass finds every fence line; prose lines in between are split with str.find
+    for match in FENCE_PATTERN.finditer(text):
+        fence_line_start = match.start()
+        fence_line_end = text.find("\n", fence_line_start)
+        fence_line_end = length if fence_line_end == -1 else fence_line_end + 1
+
+        if fence_start is None:
+            while position < fence_line_start:
+                line_end = text.find("\n", position) + 1
+                yield position, line_end, False
+                position = line_end
+            fence_start = fence_line_start
+        else:
+            yield fence_start, fence_line_end, True
+            fence_start = None
+        position = fence_line_end
+
+    if fence_start is not None:
+        # Unclosed fence: keep the rest of the text together
+        yield fence_start, length, True
+        return
+
+    while position < length:
+        line_end = text.find("\n", position)
+        line_end = length if line_end == -1 else line_end + 1
+        yield position, line_end, False
+        position = line_end
 
 def extract_code_blocks(text):
     code_blocks = []
@@ -198,13 +298,21 @@ def extract_code_blocks(text):
     return code_blocks
 
 
-def add_to_chroma(chunks: list[Document], collection_name):
-    persistent_client = chromadb.PersistentClient()
-    vector_store = Chroma(
-        client=persistent_client,
-        collection_name=collection_name,
-        embedding_function=get_embedding_function()
-    )
+def get_vector_store(collection_name, embedding_function):
+    from vector_store import open_vector_store
+
+    # Same CHROMA_PATH the retriever queries and clear_database() removes
+    return open_vector_store(collection_name, embedding_function, CHROMA_PATH, for_ingestion=True)
+
+def add_to_chroma(chunks, collection_name, stale_ids=()):
+    """Adds chunks whose IDs are not in the collection yet and deletes stale_ids."""
+    from embeddings import get_embedding_function
+    from embedding_cache import CachedEmbeddings
+    from embedding_batches import embed_texts
+
+    # Unchanged chunks are served from the on-disk cache instead of the embedding API
+    embedding_function = CachedEmbeddings(get_embedding_function())
+    vector_store = get_vector_store(collection_name, embedding_function)
     
     chunks_with_ids = calculate_chunk_ids(chunks)
     existing_items = vector_store.get(include=[])
@@ -215,36 +323,179 @@ def add_to_chroma(chunks: list[Document], collection_name):
         if chunk.metadata["id"] not in existing_ids:
             new_chunks.append(chunk)
     
+    stale_ids = [chunk_id for chunk_id in stale_ids if chunk_id in existing_ids]
+    if stale_ids:
+        print(f"🗑️  Deleting stale documents: {len(stale_ids)}")
+        vector_store.delete(ids=stale_ids)
+
     if len(new_chunks):
         print(f"👉 Adding new documents: {len(new_chunks)}")
-        new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
-        vector_store.add_documents(new_chunks, ids=new_chunk_ids)
+        start = time.perf_counter()
+        texts = [chunk.page_content for chunk in new_chunks]
+        vectors = embed_texts(embedding_function.embed_documents, texts)
+        upsert_chunks(vector_store, new_chunks, vectors)
+        elapsed = time.perf_counter() - start
+        print(f"⚡ Embedded and stored {len(new_chunks)} chunks in {elapsed:.2f}s "
+              f"({len(new_chunks) / elapsed:.1f} chunks/s)")
+        stats = embedding_function.cache.stats()
+        print(f"💾 Embedding cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['evictions']} evicted ({stats['hit_rate']:.0%} hit rate)")
     else:
         print("✅ No new documents to add")
+    embedding_function.cache.close()
+    return vector_store, existing_ids
+
+def upsert_chunks(vector_store, chunks, vectors):
+    """Writes pre-embedded chunks in the largest batches the Chroma client accepts."""
+    collection = vector_store._collection
+    batch_size = vector_store._client.get_max_batch_size()
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        collection.upsert(
+            ids=[chunk.metadata["id"] for chunk in batch],
+            embeddings=vectors[start:start + batch_size],
+            documents=[chunk.page_content for chunk in batch],
+            metadatas=[chunk.metadata for chunk in batch],
+        )
+
+def sync_database(directory_path, collection_name, full=False):
+    """Incrementally brings the collection in line with the files on disk.
+
+    Files whose mtime and size match the manifest are skipped without being
+    read; files whose content hash is unchanged are skipped without being
+    parsed. For the rest, only chunks with new content hashes are embedded and
+    chunks that disappeared are deleted.
+    """
+    manifest = load_manifest()
+    settings = {"collection": collection_name, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+    if manifest.get("settings") != settings:
+        # Different collection or chunking: nothing in the manifest can be trusted
+        full = True
+    known_files = {} if full else manifest.get("files", {})
+
+    current_files = {}
+    changed_files = []
+    for file_path in list_source_files(directory_path):
+        stat = os.stat(file_path)
+        entry = known_files.get(file_path)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            current_files[file_path] = entry
+            continue
+
+        file_hash = hash_file(file_path)
+        if entry and entry["sha256"] == file_hash:
+            current_files[file_path] = {**entry, "mtime": stat.st_mtime, "size": stat.st_size}
+            continue
+
+        current_files[file_path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": file_hash, "chunks": []}
+        changed_files.append(file_path)
+
+    removed_files = [file_path for file_path in known_files if file_path not in current_files]
+    indexes_exist = all(os.path.exists(index_path) for index_path in (LEXICAL_INDEX_PATH, VECTOR_INDEX_PATH))
+    if not changed_files and not removed_files and not full and indexes_exist:
+        save_manifest({"settings": settings, "files": current_files})
+        print("✅ No changed files")
+        return
+
+    new_chunks = []
+    for file_path in changed_files:
+        print("Loading file:", file_path)
+        chunks = calculate_chunk_ids(list(split_with_overlap(load_file(file_path), CHUNK_SIZE, CHUNK_OVERLAP)))
+        current_files[file_path]["chunks"] = [chunk.metadata["id"] for chunk in chunks]
+        new_chunks.extend(chunks)
+
+    live_ids = {chunk_id for entry in current_files.values() for chunk_id in entry["chunks"]}
+    previous_ids = {chunk_id for entry in known_files.values() for chunk_id in entry["chunks"]}
+    print(f"🔄 {len(changed_files)} changed, {len(removed_files)} removed, "
+          f"{len(current_files) - len(changed_files)} unchanged files")
+
+    vector_store, existing_ids = add_to_chroma(new_chunks, collection_name, stale_ids=previous_ids - live_ids)
+    if full:
+        # Without a trusted manifest, anything in the collection that no file produced is stale
+        orphan_ids = list(existing_ids - live_ids)
+        if orphan_ids:
+            print(f"🗑️  Deleting orphaned documents: {len(orphan_ids)}")
+            vector_store.delete(ids=orphan_ids)
+
+    update_lexical_index(vector_store, collection_name)
+    update_vector_index(vector_store, collection_name)
+    save_manifest({"settings": settings, "files": current_files})
+
+def update_lexical_index(vector_store, collection_name):
+    """Rebuilds the BM25 index from what the collection now holds."""
+    from lexical_index import build_index
+
+    start = time.perf_counter()
+    items = vector_store.get(include=["documents"])
+    meta = build_index(items["ids"], items["documents"], LEXICAL_INDEX_PATH, collection_name)
+    print(f"🔤 Lexical index: {meta['documents']} chunks, {meta['terms']} terms "
+          f"in {time.perf_counter() - start:.2f}s")
+
+def update_vector_index(vector_store, collection_name):
+    """Exports the collection for the memory-mapped NumPy retrieval backend."""
+    from vector_index import export_index
+
+    start = time.perf_counter()
+    embedder = (vector_store._collection.metadata or {}).get("embedder")
+    meta = export_index(vector_store, VECTOR_INDEX_PATH, collection_name, embedder=embedder)
+    print(f"🧮 Vector index: {meta['documents']} x {meta['dimensions']} {meta['dtype']} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(tmp_path, MANIFEST_PATH)
 
 def calculate_chunk_ids(chunks):
-    last_page_id = None
-    current_chunk_index = 0
+    """IDs are `source:page:content-hash`, so editing one chunk leaves every other ID unchanged.
+    Identical chunks on the same page get an occurrence suffix."""
+    seen = {}
     
     for chunk in chunks:
         source = chunk.metadata.get("source")
         page = chunk.metadata.get("page")
-        current_page_id = f"{source}:{page}"
-        
-        if current_page_id == last_page_id:
-            current_chunk_index += 1
-        else:
-            current_chunk_index = 0
-        
-        chunk_id = f"{current_page_id}:{current_chunk_index}"
-        last_page_id = current_page_id
+        content_hash = hash_text(chunk.page_content)[:16]
+        chunk_id = f"{source}:{page}:{content_hash}"
+
+        occurrence = seen.get(chunk_id, 0)
+        seen[chunk_id] = occurrence + 1
+        if occurrence:
+            chunk_id = f"{chunk_id}:{occurrence}"
+
+        chunk.metadata["content_hash"] = content_hash
         chunk.metadata["id"] = chunk_id
     
     return chunks
 
 def clear_database():
+    from vector_store import close_client
+
+    close_client(CHROMA_PATH)
     if os.path.exists(CHROMA_PATH):
         shutil.rmtree(CHROMA_PATH)
+    if os.path.exists(MANIFEST_PATH):
+        os.remove(MANIFEST_PATH)
+    for index_path in (LEXICAL_INDEX_PATH, VECTOR_INDEX_PATH):
+        if os.path.exists(index_path):
+            shutil.rmtree(index_path)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,62 @@
+"""LLM-free reranking of retrieved chunks.
+
+RetrieveContext fetches a wide candidate set (RERANK_CANDIDATES); this
+module narrows it to the RERANK_TOP_N chunks that go into the prompt:
+
+1. relevance = the retrieval (fused) rank blended with how much of the
+   query's vocabulary, weighted by IDF, the chunk actually contains;
+2. maximal marginal relevance then picks chunks one at a time, penalising
+   overlap with the ones already picked, so the 200-character chunk
+   overlaps and near-duplicate examples don't crowd out everything else.
+"""
+import os
+from dotenv import load_dotenv
+from lexical_index import tokenize
+
+load_dotenv()
+
+RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', "50"))
+RERANK_TOP_N = int(os.getenv('RERANK_TOP_N', "5"))
+MMR_LAMBDA = float(os.getenv('MMR_LAMBDA', "0.7"))  # 1 = relevance only, 0 = diversity only
+LEXICAL_WEIGHT = 0.5  # share of relevance coming from query-term coverage vs. retrieval rank
+
+def term_coverage(weights, chunk_terms):
+    """Weighted fraction of the query's terms (weights: term -> IDF) that appear in the chunk."""
+    total = sum(weights.values())
+    if not total:
+        return 0.0
+    return sum(weight for term, weight in weights.items() if term in chunk_terms) / total
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+def rerank(query, candidates, top_n=RERANK_TOP_N, mmr_lambda=MMR_LAMBDA, idf=None):
+    """Reorders [(Document, score)] candidates, given best first, and returns the top_n
+    as [(Document, relevance)]. `idf(term)` weights query terms; without it, or where it
+    returns None (Retriever.idf has no BM25 index), terms weigh 1."""
+    if not candidates:
+        return []
+    weights = {}
+    for term in set(tokenize(query)):
+        weight = idf(term) if idf is not None else None
+        weights[term] = 1.0 if weight is None else weight
+    chunk_terms = [set(tokenize(document.page_content)) for document, _ in candidates]
+
+    relevance = []
+    for rank, terms in enumerate(chunk_terms):
+        rank_score = 1.0 - rank / len(candidates)
+        coverage = term_coverage(weights, terms)
+        relevance.append((1 - LEXICAL_WEIGHT) * rank_score + LEXICAL_WEIGHT * coverage)
+
+    selected = []
+    remaining = list(range(len(candidates)))
+    while remaining and len(selected) < top_n:
+        def mmr(index):
+            redundancy = max((jaccard(chunk_terms[index], chunk_terms[chosen]) for chosen in selected), default=0.0)
+            return mmr_lambda * relevance[index] - (1 - mmr_lambda) * redundancy
+        best = max(remaining, key=mmr)
+        selected.append(best)
+        remaining.remove(best)
+    return [(candidates[index][0], relevance[index]) for index in selected]
@@ -0,0 +1,135 @@
+"""Append-only results sink for SaveToNotebook.
+
+Each result is one JSON line appended to query/results.jsonl under a file
+lock, so saving costs the same however many results exist and concurrent
+runs never clobber each other. The log is compacted into query/result.ipynb
+on demand (`python3 results_log.py`), at the end of main/batch runs, or
+periodically by a background thread. Only entries past the offset recorded
+in the notebook's metadata are added, so compaction can run any number of
+times. The notebook also records the log's fingerprint (inode and first
+line); when the log was truncated or rotated, compaction starts again from 0.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from filelock import FileLock
+from dotenv import load_dotenv
+from code_validator import strip_code_fences
+
+load_dotenv()
+
+RESULTS_DIR = "./query"
+RESULTS_LOG_PATH = os.getenv('RESULTS_LOG_PATH', os.path.join(RESULTS_DIR, "results.jsonl"))
+NOTEBOOK_PATH = os.getenv('RESULTS_NOTEBOOK_PATH', os.path.join(RESULTS_DIR, "result.ipynb"))
+
+def append_result(query, code_response, sources=None, timings=None, log_path=RESULTS_LOG_PATH):
+    record = {
+        "time": time.time(),
+        "query": query,
+        "code_response": code_response,
+        "sources": sources or [],
+        "timings": timings or {},
+    }
+    line = json.dumps(record) + "\n"
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    with FileLock(log_path + ".lock"):
+        with open(log_path, "a") as log:
+            log.write(line)
+
+def notebook_cell_source(query, code_response):
+    code_response_py = strip_code_fences(code_response)
+    return "###"+query.replace("\n","\n##")+"\n"+code_response_py
+
+def log_fingerprint(log_path):
+    """Identifies a log file: its inode and a hash of its first complete line, which
+    survive appends but not a rotation or a truncate followed by new writes."""
+    with open(log_path, "rb") as log:
+        inode = os.fstat(log.fileno()).st_ino
+        first_line = log.readline()
+    first_line = hashlib.sha256(first_line).hexdigest()[:16] if first_line.endswith(b"\n") else None
+    return {"inode": inode, "first_line": first_line}
+
+def compact_to_notebook(log_path=RESULTS_LOG_PATH, notebook_path=NOTEBOOK_PATH):
+    """Appends log entries not yet in the notebook as code cells. Returns the number added."""
+    import nbformat as nbf
+
+    if not os.path.exists(log_path):
+        return 0
+
+    with FileLock(notebook_path + ".lock"):
+        # Create a new notebook if it doesn't exist
+        if not os.path.exists(notebook_path):
+            nb = nbf.v4.new_notebook()
+        else:
+            try:
+                with open(notebook_path, "r") as f:
+                    nb = nbf.read(f, as_version=4)
+            except Exception:
+                # If file exists but is corrupted/empty, create a new notebook
+                nb = nbf.v4.new_notebook()
+
+        state = nb.metadata.get("cadgpt", {})
+        offset = state.get("results_log_offset", 0)
+        fingerprint = log_fingerprint(log_path)
+        # A different file (rotated) or one shorter than the offset (truncated): start over on it
+        recorded = state.get("results_log_fingerprint")
+        reset = offset > os.path.getsize(log_path) or (recorded is not None and recorded != fingerprint)
+        if reset:
+            logging.warning(f"{log_path} was truncated or rotated, compacting it from the start")
+            offset = 0
+        with open(log_path, "rb") as log:
+            if offset:
+                log.seek(offset - 1)
+                if log.read(1) != b"\n":
+                    # Mid-line, e.g. the file was swapped between the checks above: resume at the next line
+                    logging.warning(f"Offset {offset} is inside a line of {log_path}, skipping to the next one")
+                    log.readline()
+            added = 0
+            while True:
+                line = log.readline()
+                # Stop at a line still being written (no trailing newline yet)
+                if not line.endswith(b"\n"):
+                    break
+                offset = log.tell()
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning(f"Skipping an unreadable line of {log_path} before offset {offset}")
+                    continue
+                new_code_cell = nbf.v4.new_code_cell(notebook_cell_source(record["query"], record["code_response"]))
+                if "id" in new_code_cell:
+                    del new_code_cell["id"]
+                nb.cells.append(new_code_cell)
+                added += 1
+
+        if not added and not reset and recorded == fingerprint:
+            return 0
+
+        nb.metadata.setdefault("cadgpt", {}).update(results_log_offset=offset, results_log_fingerprint=fingerprint)
+        tmp_path = notebook_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            nbf.write(nb, f)
+        os.replace(tmp_path, notebook_path)
+        return added
+
+def start_background_compaction(interval=30.0, log_path=RESULTS_LOG_PATH, notebook_path=NOTEBOOK_PATH):
+    """Compacts the log into the notebook every `interval` seconds on a daemon thread.
+    Returns an Event; set it to stop the thread."""
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                compact_to_notebook(log_path, notebook_path)
+            except Exception as e:
+                logging.error(f"Notebook compaction failed: {e}")
+
+    threading.Thread(target=run, name="notebook-compaction", daemon=True).start()
+    return stop
+
+if __name__ == "__main__":
+    added = compact_to_notebook()
+    print(f"📓 Added {added} results to {NOTEBOOK_PATH}")
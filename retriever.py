@@ -0,0 +1,165 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from embeddings import get_embedding_function, check_embedder
+from vector_store import open_vector_store, close_client, CHROMA_PATH, CHROMA_COLLECTION
+from lexical_index import LexicalIndex, LEXICAL_INDEX_PATH
+from vector_index import NumpyVectorIndex, VECTOR_INDEX_PATH
+
+load_dotenv()
+
+RETRIEVAL_BACKEND = os.getenv('RETRIEVAL_BACKEND', "chroma")  # or "numpy": vector_index.NumpyVectorIndex
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', "20"))  # per ranker, before fusion
+RRF_K = 60
+
+class Retriever:
+    """Long-lived handle on the Chroma collection.
+
+    The vector store (SQLite/HNSW files), the embedding client and the BM25
+    index are opened once on first use and reused by every query until
+    `close()` or `reload()`. Safe to share across threads and flow runs:
+    searches count as readers, and `close()` waits for the ones in flight
+    before it releases the Chroma client (new searches wait for it to finish).
+    """
+    def __init__(self, persist_directory=CHROMA_PATH, collection_name=CHROMA_COLLECTION,
+                 lexical_index_path=LEXICAL_INDEX_PATH, backend=RETRIEVAL_BACKEND, vector_index_path=VECTOR_INDEX_PATH):
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.lexical_index_path = lexical_index_path
+        self.backend = backend
+        self.vector_index_path = vector_index_path
+        self._lock = threading.Condition()
+        self._readers = 0
+        self._closing = False
+        self._vector_store = None
+        self._lexical_index = None
+
+    @property
+    def is_open(self):
+        return self._vector_store is not None
+
+    def open(self):
+        with self._lock:
+            return self._open_locked()
+
+    def _open_locked(self):
+        while self._closing:
+            self._lock.wait()
+        if self._vector_store is None:
+            self._vector_store = self._open_vector_store()
+            self._lexical_index = LexicalIndex.open(self.lexical_index_path)
+            if self._lexical_index is None or self._lexical_index.collection_name != self.collection_name:
+                logging.warning(f"No lexical index for {self.collection_name} at {self.lexical_index_path}, "
+                                "using vector search only (run populate_database.py)")
+                self._lexical_index = None
+        return self._vector_store
+
+    @contextmanager
+    def _reading(self):
+        """Yields (vector store, lexical index) and keeps close() from releasing them meanwhile."""
+        with self._lock:
+            vector_store = self._open_locked()
+            self._readers += 1
+            lexical_index = self._lexical_index
+        try:
+            yield vector_store, lexical_index
+        finally:
+            with self._lock:
+                self._readers -= 1
+                if not self._readers:
+                    self._lock.notify_all()
+
+    def _open_vector_store(self):
+        embedding_function = get_embedding_function()
+        if self.backend == "numpy":
+            index = NumpyVectorIndex.open(embedding_function, self.vector_index_path)
+            if index is not None and index.collection_name == self.collection_name:
+                check_embedder(index.meta, embedding_function, self.collection_name)
+                logging.info(f"Opening NumPy vector index {self.collection_name} at {self.vector_index_path}")
+                return index
+            logging.warning(f"No NumPy vector index for {self.collection_name} at {self.vector_index_path}, "
+                            "falling back to Chroma (run populate_database.py)")
+        logging.info(f"Opening vector store {self.collection_name} at {self.persist_directory}")
+        # Raises if the collection is missing, empty or built with another embedder
+        return open_vector_store(self.collection_name, embedding_function, self.persist_directory)
+
+    def close(self):
+        with self._lock:
+            while self._closing:
+                self._lock.wait()
+            self._closing = True
+            # Searches still running on the old handle must finish before its client is stopped
+            while self._readers:
+                self._lock.wait()
+            vector_store, self._vector_store = self._vector_store, None
+            self._lexical_index = None
+        try:
+            if vector_store is not None and hasattr(vector_store, "_client"):
+                close_client(self.persist_directory)
+        finally:
+            with self._lock:
+                self._closing = False
+                self._lock.notify_all()
+
+    def reload(self):
+        """Drop the current handle and reopen, e.g. after populate_database.py rebuilt the index."""
+        self.close()
+        return self.open()
+
+    def similarity_search_with_score(self, query, k=5):
+        with self._reading() as (vector_store, _):
+            return vector_store.similarity_search_with_score(query, k=k)
+
+    def hybrid_search(self, query, k=5, candidates=HYBRID_CANDIDATES):
+        """Fuses vector and BM25 rankings with reciprocal-rank fusion.
+        Returns up to k (Document, fused score) pairs, best first."""
+        with self._reading() as (vector_store, lexical_index):
+            vector_results = vector_store.similarity_search_with_score(query, k=candidates)
+            if lexical_index is None:
+                return [(document, 1.0 / (RRF_K + rank)) for rank, (document, _) in enumerate(vector_results[:k], start=1)]
+
+            documents = {document.metadata.get("id"): document for document, _ in vector_results}
+            lexical_results = lexical_index.search(query, k=candidates)
+            fused = reciprocal_rank_fusion([
+                [document.metadata.get("id") for document, _ in vector_results],
+                [chunk_id for chunk_id, _ in lexical_results],
+            ])[:k]
+
+            # Keyword-only hits still need their text
+            missing = [chunk_id for chunk_id, _ in fused if chunk_id not in documents]
+            if missing:
+                documents.update((document.metadata.get("id"), document) for document in vector_store.get_by_ids(missing))
+        return [(documents[chunk_id], score) for chunk_id, score in fused if chunk_id in documents]
+
+    def idf(self, term):
+        """Inverse document frequency from the BM25 index, or None without one."""
+        with self._reading() as (_, lexical_index):
+            return None if lexical_index is None else lexical_index.idf(term)
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """[(id, score)] best first, where each id scores the sum of 1 / (k + rank) over the rankings."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+def get_retriever():
+    """Returns the process-wide Retriever, creating it on first call."""
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            _retriever = Retriever()
+        return _retriever
+
+def close_retriever():
+    global _retriever
+    with _retriever_lock:
+        retriever, _retriever = _retriever, None
+    if retriever is not None:
+        retriever.close()
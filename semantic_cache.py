@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from embeddings import get_embedding_function, embedder_id
+
+load_dotenv()
+
+SEMANTIC_CACHE_PATH = os.getenv('SEMANTIC_CACHE_PATH', "./.semantic_cache.sqlite3")
+# Cosine similarity a previous query needs to be reused. Keep it high:
+# "simple gear" and "simple worm gear" are close but want different code.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', "1000"))
+SEMANTIC_CACHE_BYPASS = os.getenv('SEMANTIC_CACHE_BYPASS', "").lower() in ("1", "true", "yes")
+
+class SemanticCache:
+    """Answers near-duplicate queries with previously generated CadQuery code.
+
+    Query embeddings are kept L2-normalised in an in-memory matrix (its own
+    small vector index), so a lookup is one embedding call plus one
+    matrix-vector product. Entries are persisted in SQLite and the least
+    recently used ones are evicted past `max_entries`.
+    """
+    def __init__(self, path=SEMANTIC_CACHE_PATH, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, embedding_function=None):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embedding_function = embedding_function or get_embedding_function()
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, query TEXT NOT NULL, embedding BLOB NOT NULL, "
+            "code_response TEXT NOT NULL, sources TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # Embeddings from another model are not comparable: start over when the embedder changes
+        embedder = embedder_id(self.embedding_function)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'embedder'").fetchone()
+        if row and row[0] != embedder:
+            logging.info(f"Semantic cache was built with {row[0]}, now {embedder}: clearing it")
+            self._conn.execute("DELETE FROM entries")
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedder', ?)", (embedder,))
+        self._conn.commit()
+        self._load_index()
+
+    def _load_index(self):
+        rows = self._conn.execute("SELECT id, embedding FROM entries ORDER BY id").fetchall()
+        self._ids = [row[0] for row in rows]
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = None
+
+    def embed(self, query):
+        vector = np.asarray(self.embedding_function.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query, embedding=None):
+        """Returns (entry or None, query embedding). The embedding can be passed back to add()."""
+        start = time.perf_counter()
+        embedding = self.embed(query) if embedding is None else embedding
+        entry = None
+        with self._lock:
+            if self._matrix is not None:
+                similarities = self._matrix @ embedding
+                best = int(np.argmax(similarities))
+                similarity = float(similarities[best])
+                if similarity >= self.threshold:
+                    entry_id = self._ids[best]
+                    row = self._conn.execute(
+                        "SELECT query, code_response, sources FROM entries WHERE id = ?", (entry_id,)
+                    ).fetchone()
+                    self._conn.execute(
+                        "UPDATE entries SET last_used = ?, hits = hits + 1 WHERE id = ?", (time.time(), entry_id)
+                    )
+                    self._conn.commit()
+                    entry = {
+                        "query": row[0],
+                        "code_response": row[1],
+                        "sources": json.loads(row[2]),
+                        "similarity": similarity,
+                    }
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.lookup_seconds += time.perf_counter() - start
+        return entry, embedding
+
+    def add(self, query, code_response, sources, embedding=None):
+        embedding = self.embed(query) if embedding is None else embedding
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO entries (query, embedding, code_response, sources, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (query, embedding.astype(np.float32).tobytes(), code_response, json.dumps(sources), now, now)
+            )
+            self._ids.append(cursor.lastrowid)
+            row = embedding.astype(np.float32)[np.newaxis, :]
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+
+            overflow = len(self._ids) - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE id IN (SELECT id FROM entries ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self._load_index()
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._load_index()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_lookup_ms": self.lookup_seconds / lookups * 1000 if lookups else 0.0,
+        }
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+def get_semantic_cache():
+    """Returns the process-wide SemanticCache, creating it on first call."""
+    global _semantic_cache
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticCache()
+            logging.info(f"Semantic cache: {len(_semantic_cache._ids)} entries, threshold {_semantic_cache.threshold}")
+        return _semantic_cache
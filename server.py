@@ -0,0 +1,83 @@
+"""HTTP front-end for the RAG flow.
+
+    uvicorn server:app --loop uvloop --port 8000
+    curl -X POST localhost:8000/query -H 'Content-Type: application/json' -d '{"query": "produce me a simple gear"}'
+
+Each request runs query_rag in a worker thread (SERVICE_WORKERS of them;
+more requests wait for a free one). The retriever, guide index, model
+client and validation pool are opened at startup and shared by every
+request, and LLM_CONCURRENCY bounds the model calls in flight across all of
+them. If the client disconnects, its flow is cancelled at the next node or
+generated token.
+"""
+import os
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request, Response
+from pydantic import BaseModel
+
+from main import query_rag, get_openai_model
+from retriever import get_retriever, close_retriever
+from guide_index import get_guide_index
+from worker_pool import get_worker_pool
+from results_log import compact_to_notebook
+
+load_dotenv()
+
+SERVICE_WORKERS = int(os.getenv('SERVICE_WORKERS', "16"))
+DISCONNECT_POLL_SECONDS = 0.5
+
+class QueryRequest(BaseModel):
+    query: str
+    use_semantic_cache: bool = True
+
+@asynccontextmanager
+async def lifespan(app):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=SERVICE_WORKERS))
+    # Pay for opening everything once, before the first request
+    get_retriever().open()
+    get_guide_index().refresh()
+    get_openai_model()
+    pool = get_worker_pool()
+    if pool is not None:
+        pool.warm_up()  # CadQuery imports take seconds
+    logging.info(f"Service ready with {SERVICE_WORKERS} workers")
+    yield
+    close_retriever()
+    compact_to_notebook()
+
+app = FastAPI(title="cadgpt", lifespan=lifespan)
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "retriever_open": get_retriever().is_open}
+
+@app.post("/query")
+async def query(body: QueryRequest, request: Request):
+    cancel = threading.Event()
+    flow = asyncio.ensure_future(asyncio.to_thread(
+        query_rag, body.query, use_semantic_cache=body.use_semantic_cache, echo=False, cancel=cancel))
+    try:
+        while not flow.done():
+            await asyncio.wait({flow}, timeout=DISCONNECT_POLL_SECONDS)
+            if not flow.done() and await request.is_disconnected():
+                logging.info("Client disconnected, cancelling its query")
+                cancel.set()
+                return Response(status_code=499)
+    except asyncio.CancelledError:
+        cancel.set()  # server shutting down
+        raise
+    shared = flow.result()
+    return {
+        "code_response": shared.get("code_response"),
+        "sources": shared.get("sources"),
+        "error": shared.get("error"),
+        "semantic_cache_hit": shared.get("semantic_cache_hit"),
+        "code_verification": shared.get("code_verification"),
+        "generation": shared.get("generation"),
+        "timings": shared.get("timings", {}),
+    }
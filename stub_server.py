@@ -0,0 +1,273 @@
+"""A local OpenAI-compatible stand-in for benchmarks: /v1/chat/completions and /v1/embeddings.
+
+Point the flow and ingestion at it with LLM_BASE_URL and EMBEDDING_BASE_URL
+(e.g. http://127.0.0.1:8001/v1) and nothing reaches the real API:
+
+    python3 stub_server.py --port 8001 --chat-latency lognormal:0.4,0.3 --tokens-per-second 80 --error-rate 0.02
+
+Chat replies are canned. Code generation prompts get a CadQuery script
+picked by keywords in the request (mug, gear, box...); everything else gets
+a short text. STUB_RESPONSES_PATH can add {"pattern", "response"} rules, which
+are tried first. The first token comes after a delay drawn from
+STUB_CHAT_LATENCY; the rest follow at STUB_TOKENS_PER_SECOND, streamed as
+server-sent events when asked for. Latencies are written as
+`fixed:S`, `uniform:A,B`, `normal:MEAN,SD`, `lognormal:MEDIAN,SIGMA` or
+`exponential:MEAN`, all in seconds.
+
+Embeddings are unit vectors derived from a hash of each input, so the same
+text always gets the same vector. Errors can be injected:
+
+- STUB_ERROR_RATE of requests fail with one of STUB_ERROR_CODES (429s carry Retry-After);
+- STUB_INVALID_CODE_RATE of generations call a method cq.Workplane does not have.
+
+Draws come from one generator seeded with STUB_SEED. GET /stats counts
+what was served.
+"""
+import os
+import re
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+load_dotenv()
+
+settings = {
+    "chat_latency": os.getenv('STUB_CHAT_LATENCY', "fixed:0.2"),  # time to first token
+    "embedding_latency": os.getenv('STUB_EMBEDDING_LATENCY', "fixed:0.05"),
+    "tokens_per_second": float(os.getenv('STUB_TOKENS_PER_SECOND', "100")),
+    "embedding_dimensions": int(os.getenv('STUB_EMBEDDING_DIMENSIONS', "1536")),
+    "error_rate": float(os.getenv('STUB_ERROR_RATE', "0")),
+    "error_codes": os.getenv('STUB_ERROR_CODES', "429,500,503"),
+    "invalid_code_rate": float(os.getenv('STUB_INVALID_CODE_RATE', "0")),
+    "responses_path": os.getenv('STUB_RESPONSES_PATH'),
+    "seed": int(os.getenv('STUB_SEED', "0")),
+}
+
+CODE_RESPONSES = {
+    "mug": """import cadquery as cq
+
+height = 100
+radius = 40
+wall = 4
+body = cq.Workplane("XY").circle(radius).extrude(height).faces(">Z").shell(-wall)
+handle = (cq.Workplane("XZ").center(radius + 15, height / 2)
+          .rect(30, 60).rect(18, 44).extrude(5, both=True))
+result = body.union(handle)
+display(result)""",
+    "gear": """import math
+import cadquery as cq
+
+teeth = 12
+outer_radius = 30
+tooth_depth = 4
+thickness = 8
+points = []
+for i in range(teeth * 2):
+    angle = i * math.pi / teeth
+    r = outer_radius if i % 2 == 0 else outer_radius - tooth_depth
+    points.append((r * math.cos(angle), r * math.sin(angle)))
+result = cq.Workplane("XY").polyline(points).close().extrude(thickness).faces(">Z").workplane().hole(10)
+display(result)""",
+    "box": """import cadquery as cq
+
+length = 80
+width = 60
+height = 40
+result = cq.Workplane("XY").box(length, width, height).faces(">Z").workplane().hole(20).edges("|Z").fillet(5)
+display(result)""",
+    "": """import cadquery as cq
+
+radius = 10
+height = 20
+result = cq.Workplane("XY").circle(radius).extrude(height).faces(">Z").workplane().hole(radius)
+display(result)""",
+}
+CODE_KEYWORDS = {"mug": ("mug", "cup", "handle"), "gear": ("gear", "cog", "teeth"), "box": ("box", "cube", "enclosure")}
+EVALUATION_RESPONSE = "Relevance: 8/10. The context covers the operations the request needs."
+TEXT_RESPONSE = "The request describes a single solid: sketch the profile on the XY plane, extrude it, then add the features."
+
+app = FastAPI(title="cadgpt stub")
+_rng = random.Random(settings["seed"])
+_rng_lock = threading.Lock()
+_stats = {"chat_requests": 0, "embedding_requests": 0, "embedded_inputs": 0, "completion_tokens": 0,
+          "errors_injected": 0, "invalid_code_injected": 0}
+_rules = None
+
+def parse_distribution(spec):
+    """Returns a function of a random.Random that draws a delay in seconds from `spec`."""
+    kind, _, args = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    values = [float(value) for value in args.split(",")]
+    draws = {
+        "fixed": lambda rng: values[0],
+        "uniform": lambda rng: rng.uniform(values[0], values[1]),
+        "normal": lambda rng: rng.gauss(values[0], values[1]),
+        "lognormal": lambda rng: rng.lognormvariate(math.log(values[0]), values[1]),
+        "exponential": lambda rng: rng.expovariate(1 / values[0]),
+    }
+    if kind not in draws:
+        raise ValueError(f"Unknown latency distribution {spec!r}")
+    return lambda rng: max(0.0, draws[kind](rng))
+
+def _draw(spec):
+    with _rng_lock:
+        return parse_distribution(spec)(_rng)
+
+def _chance(rate):
+    with _rng_lock:
+        return rate > 0 and _rng.random() < rate
+
+def _count(**counts):
+    with _rng_lock:
+        for key, value in counts.items():
+            _stats[key] += value
+
+def _injected_error():
+    if not _chance(settings["error_rate"]):
+        return None
+    codes = [int(code) for code in settings["error_codes"].split(",")]
+    with _rng_lock:
+        status = _rng.choice(codes)
+    _count(errors_injected=1)
+    error = {"error": {"message": f"Injected error {status}", "type": "stub_error", "code": status}}
+    return JSONResponse(error, status_code=status, headers={"Retry-After": "1"} if status == 429 else None)
+
+def _custom_rules():
+    global _rules
+    if _rules is None:
+        _rules = []
+        if settings["responses_path"]:
+            with open(settings["responses_path"], "r") as file:
+                _rules = [(re.compile(rule["pattern"]), rule["response"]) for rule in json.load(file)]
+    return _rules
+
+def canned_response(prompt):
+    for pattern, response in _custom_rules():
+        if pattern.search(prompt):
+            return response
+    if "Generate CadQuery code" not in prompt:
+        return EVALUATION_RESPONSE if prompt.startswith("Rate how relevant") else TEXT_RESPONSE
+    # Match keywords against the request only, not the context pasted above it
+    request = prompt.rsplit("Generate CadQuery code for the following request:", 1)[-1]
+    request = request.split("**Guidelines:**", 1)[0].lower()
+    name = next((name for name, words in CODE_KEYWORDS.items() if any(word in request for word in words)), "")
+    code = CODE_RESPONSES[name]
+    if _chance(settings["invalid_code_rate"]):
+        _count(invalid_code_injected=1)
+        code = code.replace(".extrude(", ".extrudee(", 1)
+    return f"```python\n{code}\n```"
+
+def _tokens(text):
+    # Roughly one token per word or punctuation run, keeping the whitespace with it
+    return re.findall(r"\s*\S+", text)
+
+def _vector(value):
+    seed = int.from_bytes(hashlib.sha256(json.dumps(value).encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(settings["embedding_dimensions"])
+    return (vector / np.linalg.norm(vector)).tolist()
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    _count(chat_requests=1)
+    error = _injected_error()
+    if error is not None:
+        return error
+    prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+    tokens = _tokens(canned_response(prompt))
+    prompt_tokens = len(_tokens(prompt))
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+    _count(completion_tokens=len(tokens))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model", "stub")
+    await asyncio.sleep(_draw(settings["chat_latency"]))
+
+    if not body.get("stream"):
+        await asyncio.sleep(len(tokens) / settings["tokens_per_second"])
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    async def events():
+        def chunk(choices, **extra):
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": choices, **extra}
+            return f"data: {json.dumps(data)}\n\n"
+
+        yield chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for index, token in enumerate(tokens):
+            if index:
+                await asyncio.sleep(1 / settings["tokens_per_second"])
+            yield chunk([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk([], usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    _count(embedding_requests=1)
+    error = _injected_error()
+    if error is not None:
+        return error
+    inputs = body["input"]
+    # A single string, a list of strings or a list of token-ID lists
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    _count(embedded_inputs=len(inputs))
+    await asyncio.sleep(_draw(settings["embedding_latency"]))
+    return JSONResponse({
+        "object": "list",
+        "data": [{"object": "embedding", "index": index, "embedding": _vector(value)} for index, value in enumerate(inputs)],
+        "model": body.get("model", "stub"),
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    })
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "o3-mini", "object": "model"}, {"id": "text-embedding-3-small", "object": "model"}]}
+
+@app.get("/stats")
+async def stats():
+    with _rng_lock:
+        return dict(_stats)
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--chat-latency", help="Time to first token, e.g. lognormal:0.4,0.3")
+    parser.add_argument("--embedding-latency", help="Per embeddings request, e.g. fixed:0.05")
+    parser.add_argument("--tokens-per-second", type=float)
+    parser.add_argument("--error-rate", type=float, help="Fraction of requests that fail.")
+    parser.add_argument("--error-codes", help="Comma-separated HTTP statuses to fail with.")
+    parser.add_argument("--invalid-code-rate", type=float, help="Fraction of generations with a bad method call.")
+    parser.add_argument("--responses", dest="responses_path", help="JSON list of {pattern, response} rules.")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    settings.update({key: value for key, value in vars(args).items() if key in settings and value is not None})
+    for key in ("chat_latency", "embedding_latency"):
+        parse_distribution(settings[key])  # fail now rather than on the first request
+    _rng.seed(settings["seed"])
+    print(f"🧪 Stub OpenAI API on http://{args.host}:{args.port}/v1")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""LocalOnnxEmbeddings against reference implementations of all-MiniLM-L6-v2.
+
+Needs the model (Chroma's ONNX export, downloaded on first use); skipped
+when it cannot be loaded. The sentence-transformers comparison also needs
+that package and the model from the Hugging Face hub.
+
+test_matches_reference_vectors compares with sentence-transformers vectors
+vendored in fixtures/minilm_reference.json instead. Write that file where
+sentence-transformers and the model are available:
+
+    python -m tests.test_local_embeddings --write-reference
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from local_embeddings import LocalOnnxEmbeddings, DEFAULT_MODEL_DIR, load_model
+
+SENTENCES = [
+    "produce me a simple gear",
+    "Create a parametric mug with a handle, a base plate and a hollow body of 0.3 inch walls",
+    "twistExtrude",
+    "result = cq.Workplane('XY').polygon(6, 5).extrude(2).faces('>Z').workplane().circle(1).cutThruAll()",
+]
+TOLERANCE = 1e-4
+REFERENCE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "minilm_reference.json")
+MIN_COSINE = 0.999
+
+def sentence_transformers_vectors(sentences):
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", device="cpu")
+    return model.encode(sentences, normalize_embeddings=True)
+
+@pytest.fixture(scope="module")
+def embeddings():
+    try:
+        load_model(DEFAULT_MODEL_DIR)
+    except Exception as e:
+        pytest.skip(f"all-MiniLM-L6-v2 ONNX model unavailable: {e}")
+    return LocalOnnxEmbeddings(DEFAULT_MODEL_DIR)
+
+def test_matches_sentence_transformers(embeddings):
+    pytest.importorskip("sentence_transformers")
+    try:
+        expected = sentence_transformers_vectors(SENTENCES)
+    except Exception as e:
+        pytest.skip(f"sentence-transformers model unavailable: {e}")
+    np.testing.assert_allclose(np.array(embeddings.embed_documents(SENTENCES)), expected, atol=TOLERANCE)
+
+def test_matches_reference_vectors(embeddings):
+    if not os.path.exists(REFERENCE_PATH):
+        pytest.skip(f"{REFERENCE_PATH} not written yet; see the module docstring")
+    with open(REFERENCE_PATH, "r") as file:
+        reference = json.load(file)
+    expected = np.array(reference["vectors"])
+    actual = np.array(embeddings.embed_documents(reference["sentences"]))
+    cosines = np.sum(actual * expected, axis=1) / (np.linalg.norm(actual, axis=1) * np.linalg.norm(expected, axis=1))
+    assert cosines.min() > MIN_COSINE, dict(zip(reference["sentences"], cosines))
+
+def test_matches_chroma_onnx(embeddings):
+    from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+
+    expected = np.array(ONNXMiniLM_L6_V2()(SENTENCES))
+    np.testing.assert_allclose(np.array(embeddings.embed_documents(SENTENCES)), expected, atol=TOLERANCE)
+
+def test_padding_does_not_change_vectors(embeddings):
+    one_by_one = LocalOnnxEmbeddings(DEFAULT_MODEL_DIR, batch_size=1).embed_documents(SENTENCES)
+    np.testing.assert_allclose(np.array(embeddings.embed_documents(SENTENCES)), np.array(one_by_one), atol=1e-5)
+
+def test_query_matches_document(embeddings):
+    vector = embeddings.embed_query(SENTENCES[0])
+    np.testing.assert_allclose(vector, embeddings.embed_documents(SENTENCES[:1])[0], atol=1e-6)
+    assert embeddings.embed_query(SENTENCES[0]) == vector  # from the LRU
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["--write-reference"]:
+        sys.exit(f"usage: python -m tests.test_local_embeddings --write-reference")
+    vectors = sentence_transformers_vectors(SENTENCES).tolist()
+    os.makedirs(os.path.dirname(REFERENCE_PATH), exist_ok=True)
+    with open(REFERENCE_PATH, "w") as file:
+        json.dump({"model": "sentence-transformers/all-MiniLM-L6-v2", "sentences": SENTENCES, "vectors": vectors}, file)
+        file.write("\n")
+    print(f"✅ Wrote {len(SENTENCES)} reference vectors to {REFERENCE_PATH}")
@@ -0,0 +1,19 @@
+from langchain_core.documents import Document
+
+from reranker import rerank
+
+CANDIDATES = [
+    (Document(page_content="Use twistExtrude to twist a profile while extruding it."), 0.9),
+    (Document(page_content="A box with a hole through the top face."), 0.8),
+    (Document(page_content="Shell a cube and chamfer the inside edges."), 0.7),
+]
+
+def test_rerank_without_lexical_index():
+    # Retriever.idf returns None for every term when there is no BM25 index (vector-only mode)
+    results = rerank("twistExtrude a profile", CANDIDATES, top_n=2, idf=lambda term: None)
+    assert [document for document, _ in results] == [CANDIDATES[0][0], CANDIDATES[1][0]]
+
+def test_rerank_none_idf_weighs_like_uniform():
+    uniform = rerank("box with a hole", CANDIDATES, top_n=3)
+    unindexed = rerank("box with a hole", CANDIDATES, top_n=3, idf=lambda term: None)
+    assert uniform == unindexed
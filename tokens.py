@@ -0,0 +1,29 @@
+"""Token counting shared by ingestion batching and prompt budgeting.
+
+tiktoken downloads its encoding files on first use; offline, or without
+tiktoken, counts fall back to the usual ~4 characters per token estimate.
+"""
+import logging
+import threading
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+def get_encoding(name):
+    """The tiktoken encoding `name`, or None if it is unavailable."""
+    with _encodings_lock:
+        if name not in _encodings:
+            try:
+                import tiktoken
+                _encodings[name] = tiktoken.get_encoding(name)
+            except Exception as e:
+                # tiktoken missing, or its encoding file could not be downloaded
+                logging.warning(f"Falling back to estimated token counts: {e}")
+                _encodings[name] = None
+        return _encodings[name]
+
+def count_tokens(texts, encoding_name="cl100k_base"):
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return [len(text) // 4 + 1 for text in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
@@ -0,0 +1,116 @@
+"""Exact nearest-neighbour search over a memory-mapped NumPy copy of the collection.
+
+The corpus is a few thousand chunks, so one matrix-vector product over all
+of them is faster than going through Chroma's SQLite and HNSW layers.
+populate_database.py exports the collection after every sync to:
+
+    embeddings.npy   L2-normalised rows, float32 (or float16, VECTOR_INDEX_DTYPE)
+    documents.jsonl  {"id", "page_content", "metadata"} per row
+    offsets.npy      byte offset of each row's line in documents.jsonl
+
+Only the rows in a result are ever parsed from the sidecar. Select it for
+queries with RETRIEVAL_BACKEND=numpy.
+"""
+import os
+import json
+import shutil
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH', "./.vector_index")
+VECTOR_INDEX_DTYPE = os.getenv('VECTOR_INDEX_DTYPE', "float32")
+
+def export_index(vector_store, path=VECTOR_INDEX_PATH, collection_name=None, dtype=VECTOR_INDEX_DTYPE, embedder=None):
+    """Writes every chunk of `vector_store` (a langchain Chroma) with its embedding to `path`."""
+    items = vector_store.get(include=["embeddings", "documents", "metadatas"])
+    embeddings = np.asarray(items["embeddings"], dtype=np.float32)
+    if not items["ids"]:
+        embeddings = np.zeros((0, 0), dtype=np.float32)  # everything was removed: an empty index
+    elif embeddings.ndim != 2:
+        embeddings = embeddings.reshape(len(items["ids"]), -1)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1, norms)
+
+    tmp_path = path.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "embeddings.npy"), embeddings.astype(dtype))
+
+    offsets = np.zeros(len(items["ids"]) + 1, dtype=np.int64)
+    with open(os.path.join(tmp_path, "documents.jsonl"), "wb") as file:
+        for row, (chunk_id, text, metadata) in enumerate(zip(items["ids"], items["documents"], items["metadatas"])):
+            file.write((json.dumps({"id": chunk_id, "page_content": text, "metadata": metadata or {}}) + "\n").encode("utf-8"))
+            offsets[row + 1] = file.tell()
+    np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+
+    meta = {"collection": collection_name, "embedder": embedder, "documents": len(items["ids"]),
+            "dimensions": int(embeddings.shape[1]) if len(embeddings) else 0, "dtype": dtype}
+    with open(os.path.join(tmp_path, "meta.json"), "w") as file:
+        json.dump(meta, file)
+
+    old_path = path.rstrip("/") + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return meta
+
+class NumpyVectorIndex:
+    """Read-only stand-in for the Chroma vector store used by Retriever.
+
+    Scores are cosine distances (0 = identical), so like Chroma's, lower is better.
+    """
+    def __init__(self, path, embedding_function):
+        with open(os.path.join(path, "meta.json"), "r") as file:
+            self.meta = json.load(file)
+        self.path = path
+        self.collection_name = self.meta.get("collection")
+        self.embedding_function = embedding_function
+        self._embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        self._offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self._documents = np.memmap(os.path.join(path, "documents.jsonl"), dtype=np.uint8, mode="r") \
+            if self._offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self._row_by_id = None
+
+    @classmethod
+    def open(cls, embedding_function, path=VECTOR_INDEX_PATH):
+        """Returns None if no index was exported to `path`."""
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return cls(path, embedding_function)
+
+    def __len__(self):
+        return self.meta["documents"]
+
+    def _document(self, row):
+        from langchain_core.documents import Document
+
+        line = self._documents[self._offsets[row]:self._offsets[row + 1]].tobytes()
+        record = json.loads(line)
+        return Document(id=record["id"], page_content=record["page_content"], metadata=record["metadata"])
+
+    def search_by_vector(self, embedding, k=5):
+        """[(row, cosine distance)] for the k nearest rows, nearest first."""
+        if not len(self):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+        similarities = self._embeddings @ query.astype(self._embeddings.dtype)
+        k = min(k, len(similarities))
+        rows = np.argpartition(-similarities, k - 1)[:k]
+        rows = rows[np.argsort(-similarities[rows], kind="stable")]
+        return [(int(row), float(1.0 - similarities[row])) for row in rows]
+
+    def similarity_search_with_score(self, query, k=5):
+        embedding = self.embedding_function.embed_query(query)
+        return [(self._document(row), distance) for row, distance in self.search_by_vector(embedding, k)]
+
+    def get_by_ids(self, ids):
+        if self._row_by_id is None:
+            # Built on first use only; hybrid search needs it for keyword-only hits
+            self._row_by_id = {self._document(row).id: row for row in range(len(self))}
+        return [self._document(self._row_by_id[chunk_id]) for chunk_id in ids if chunk_id in self._row_by_id]
@@ -0,0 +1,90 @@
+"""The one place Chroma is opened from.
+
+populate_database.py, view_database.py and the retriever all go through
+`open_vector_store`, so they read and write the same CHROMA_PATH and
+collection. Clients are cached per path and reused; `close_client` drops
+one so the next open reads the files from disk again.
+"""
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+
+# chromadb and langchain are imported inside the functions that use them, so
+# importing this module stays cheap for populate_database.py's no-op syncs.
+
+load_dotenv()
+
+# chromadb.PersistentClient() defaults to ./chroma; be explicit everywhere
+CHROMA_PATH = os.getenv('CHROMA_PATH') or "./chroma"
+CHROMA_COLLECTION = os.getenv('CHROMA_COLLECTION_DESC')
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(path=CHROMA_PATH):
+    """Returns the process-wide PersistentClient for `path`."""
+    import chromadb
+
+    path = os.path.abspath(path)
+    with _clients_lock:
+        if path not in _clients:
+            logging.info(f"Opening Chroma at {path}")
+            _clients[path] = chromadb.PersistentClient(path=path)
+        return _clients[path]
+
+def close_client(path=CHROMA_PATH):
+    with _clients_lock:
+        client = _clients.pop(os.path.abspath(path), None)
+    if client is None:
+        return
+    from chromadb.api.shared_system_client import SharedSystemClient
+    # Chroma caches one System per persist directory; stop it and evict it so a
+    # later open reads the files from disk again instead of the stale handle.
+    system = SharedSystemClient._identifier_to_system.pop(getattr(client, "_identifier", None), None)
+    if system is not None:
+        system.stop()
+
+def open_vector_store(collection_name=CHROMA_COLLECTION, embedding_function=None, path=CHROMA_PATH,
+                      for_ingestion=False):
+    """Returns a langchain Chroma on `collection_name` at `path`.
+
+    For queries the collection must exist, hold documents and have been built
+    with the same embedder as `embedding_function`; otherwise ValueError.
+    With `for_ingestion` it is created if needed and the embedder is recorded
+    while it is empty; an older unlabeled collection only has to match in dimension.
+    """
+    from langchain_chroma import Chroma
+    from embeddings import get_embedding_function, embedder_id, check_embedder, embedder_mismatch
+
+    if not collection_name:
+        raise ValueError("No collection configured: set CHROMA_COLLECTION_DESC")
+    embedding_function = embedding_function or get_embedding_function()
+    client = get_client(path)
+    if not for_ingestion:
+        try:
+            client.get_collection(collection_name)
+        except Exception as e:  # the exception type differs between chromadb versions
+            raise ValueError(f"Collection {collection_name} does not exist in {path}; run populate_database.py") from e
+
+    vector_store = Chroma(client=client, collection_name=collection_name, embedding_function=embedding_function)
+    collection = vector_store._collection
+    check_embedder(collection.metadata, embedding_function, collection_name)
+    if for_ingestion:
+        labeled = bool((collection.metadata or {}).get("embedder"))
+        if not labeled and collection.count() == 0:
+            # Refuse to mix vectors from two models later; record the model on first use
+            metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+            collection.modify(metadata={**metadata, "embedder": embedder_id(embedding_function)})
+        elif not labeled:
+            # Built before the embedder was recorded: the model is unknown, so leave it
+            # unlabeled, but at least refuse vectors of a different size
+            stored = collection.get(limit=1, include=["embeddings"])["embeddings"]
+            stored_dimensions = len(stored[0])
+            dimensions = len(embedding_function.embed_query("dimension probe"))
+            if stored_dimensions != dimensions:
+                raise embedder_mismatch(collection_name, f"{stored_dimensions}-dimension vectors",
+                                        f"{embedder_id(embedding_function)} ({dimensions} dimensions)")
+    elif collection.count() == 0:
+        raise ValueError(f"Collection {collection_name} in {path} is empty; run populate_database.py")
+    return vector_store
@@ -1,15 +1,10 @@
-import os
-from langchain_chroma import Chroma
-import chromadb
-from dotenv import load_dotenv
-load_dotenv()
+from vector_store import get_client, CHROMA_PATH, CHROMA_COLLECTION
 
-CHROMA_COLLECTION = os.getenv('CHROMA_COLLECTION_DESC')
-
-persistent_client = chromadb.PersistentClient()
-collection = persistent_client.get_or_create_collection(CHROMA_COLLECTION)
+# Same store populate_database.py writes and the retriever reads
+collection = get_client(CHROMA_PATH).get_or_create_collection(CHROMA_COLLECTION)
 # Retrieve all documents and embeddings
 documents = collection.get()
 
 # include=["documents", "embeddings", "metadatas", "ids"]
-print(documents["metadatas"])
\ No newline at end of file
+print(f"{CHROMA_COLLECTION} at {CHROMA_PATH}: {collection.count()} documents, embedder {(collection.metadata or {}).get('embedder')}")
+print(documents["metadatas"])
@@ -0,0 +1,215 @@
+"""Pool of pre-warmed worker processes that have already imported CadQuery.
+
+Importing cadquery/OCP takes seconds, so running every generated script in a
+fresh interpreter is dominated by start-up. Workers here import it once, then
+take jobs (a picklable function plus arguments) over a pipe. A job that runs
+past its timeout gets its worker killed and replaced; workers are also
+recycled after `max_jobs` jobs or once their RSS passes `max_rss_mb`.
+Workers get the same sandbox as code_validator's cold path: the memory
+limit, a CPU limit of the job's timeout per job, only SANDBOX_ENV_KEYS in
+the environment and a throwaway working directory.
+
+    pool = CadQueryWorkerPool(size=2)
+    report = pool.call(run_script, code, timeout=60)
+"""
+import os
+import queue
+import atexit
+import logging
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+VALIDATION_POOL_SIZE = int(os.getenv('VALIDATION_POOL_SIZE', "2"))  # 0 = cold subprocess per script
+VALIDATION_POOL_MAX_JOBS = int(os.getenv('VALIDATION_POOL_MAX_JOBS', "50"))
+VALIDATION_POOL_MAX_RSS_MB = int(os.getenv('VALIDATION_POOL_MAX_RSS_MB', "2048"))
+WORKER_STARTUP_TIMEOUT = 120.0  # seconds allowed for a worker to import CadQuery
+
+class WorkerTimeout(Exception):
+    pass
+
+class WorkerDied(Exception):
+    pass
+
+def _current_rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak * 1024 if os.uname().sysname != "Darwin" else peak
+
+def _limit_cpu(seconds):
+    """Lets this process use `seconds` more CPU time; past that the kernel kills it (SIGXCPU)."""
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def _worker_main(conn, memory_mb):
+    import tempfile
+    from code_validator import scrub_environment
+
+    scrub_environment()  # spawned workers inherit the parent's environment, API keys included
+    if memory_mb and os.name == "posix":
+        import resource
+        memory = memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        except (ValueError, OSError):
+            pass
+    try:
+        import cadquery  # noqa: F401  (the point of the pool: pay this once)
+    except Exception:
+        pass  # jobs will report the environment problem themselves
+    conn.send(("ready", None, _current_rss()))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        fn, args, timeout = job
+        # Unpickling fn can import modules that run load_dotenv() again
+        scrub_environment()
+        if os.name == "posix":
+            _limit_cpu(timeout)
+        with tempfile.TemporaryDirectory(prefix="cadgpt-worker-") as workdir:
+            # Files a job writes land in a throwaway directory
+            os.chdir(workdir)
+            try:
+                conn.send(("ok", fn(*args), _current_rss()))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}", _current_rss()))
+            finally:
+                os.chdir(os.path.dirname(workdir))
+
+class _Worker:
+    def __init__(self, context, memory_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.jobs = 0
+        self.rss = 0
+
+    def _receive(self, timeout):
+        if not self.conn.poll(timeout):
+            raise WorkerTimeout()
+        try:
+            status, value, self.rss = self.conn.recv()
+        except EOFError:
+            self.process.join(timeout=1)
+            raise WorkerDied(f"Worker exited with code {self.process.exitcode}")
+        return status, value
+
+    def call(self, fn, args, timeout):
+        if not self.ready:
+            self._receive(WORKER_STARTUP_TIMEOUT)
+            self.ready = True
+        try:
+            self.conn.send((fn, args, timeout))
+        except (BrokenPipeError, OSError):
+            raise WorkerDied(f"Worker exited with code {self.process.exitcode}")
+        status, value = self._receive(timeout)
+        self.jobs += 1
+        if status == "error":
+            raise RuntimeError(value)
+        return value
+
+    def stop(self, kill=False):
+        if not kill and self.process.is_alive():
+            try:
+                self.conn.send(None)
+                self.process.join(timeout=5)
+            except (BrokenPipeError, OSError):
+                pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+class CadQueryWorkerPool:
+    def __init__(self, size=VALIDATION_POOL_SIZE, max_jobs=VALIDATION_POOL_MAX_JOBS,
+                 max_rss_mb=VALIDATION_POOL_MAX_RSS_MB, memory_mb=None):
+        from code_validator import VALIDATION_MEMORY_MB
+
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.memory_mb = VALIDATION_MEMORY_MB if memory_mb is None else memory_mb
+        # spawn, not fork: the parent has threads and open clients that must not be copied
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.recycled = 0
+        for _ in range(size):
+            self._idle.put(_Worker(self._context, self.memory_mb))
+
+    def warm_up(self):
+        """Blocks until every idle worker has finished importing CadQuery."""
+        workers = [self._idle.get() for _ in range(self.size)]
+        for worker in workers:
+            if not worker.ready:
+                try:
+                    worker._receive(WORKER_STARTUP_TIMEOUT)
+                    worker.ready = True
+                except (WorkerTimeout, WorkerDied):
+                    worker = self._replace(worker)
+            self._idle.put(worker)
+
+    def call(self, fn, *args, timeout=60.0):
+        """Runs fn(*args) in a warm worker. Raises WorkerTimeout or WorkerDied after
+        replacing the worker, RuntimeError if fn raised."""
+        if self._closed:
+            raise RuntimeError("Worker pool is closed")
+        worker = self._idle.get()
+        try:
+            result = worker.call(fn, args, timeout)
+        except (WorkerTimeout, WorkerDied):
+            self._idle.put(self._replace(worker))
+            raise
+        except BaseException:
+            self._idle.put(worker)
+            raise
+
+        if worker.jobs >= self.max_jobs or worker.rss > self.max_rss_mb * 1024 * 1024:
+            worker = self._replace(worker, kill=False)
+        self._idle.put(worker)
+        return result
+
+    def _replace(self, worker, kill=True):
+        worker.stop(kill=kill)
+        with self._lock:
+            self.recycled += 1
+        logging.debug(f"Recycled CadQuery worker after {worker.jobs} jobs ({worker.rss / 2**20:.0f} MB)")
+        return _Worker(self._context, self.memory_mb)
+
+    def close(self):
+        self._closed = True
+        for _ in range(self.size):
+            self._idle.get().stop()
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+def get_worker_pool():
+    """Returns the process-wide pool, or None when VALIDATION_POOL_SIZE is 0."""
+    global _worker_pool
+    if VALIDATION_POOL_SIZE <= 0:
+        return None
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = CadQueryWorkerPool()
+            atexit.register(_worker_pool.close)
+        return _worker_pool